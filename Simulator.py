@@ -1,6 +1,9 @@
-import random
+import copy
 import time
-import pygame
+import warnings
+from collections import deque
+from array import array
+import numpy as np
 HEIGHT = 800
 WIDTH = 600
 ROWS = 100
@@ -11,48 +14,156 @@ HEADERS = [("Non Infected", (0, 255, 0)), ("Infected", (255, 0, 0))]
 EXTENSION_FOR_TEXT = 100
 INFECTED = "Infected"
 NON_INFECTED = "Non Infected"
+# codes of the cells in `Simulation.state_grid` and in the arrays of the synchronous engines.
+EMPTY_STATE = 0
+NON_INFECTED_STATE = 1
+INFECTED_STATE = 2
+MOVE_SET = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+# the skepticism levels, per level counts are arrays indexed by the level (index 0 unused).
+LEVELS = [1, 2, 3, 4]
+ENGINES = ["python", "numpy", "frontier", "numba", "tiled", "graph"]
+# engines that keep the population as arrays instead of Person objects.
+ARRAY_ENGINES = ["numpy", "numba", "tiled", "graph"]
+# engines that run a different model than the reference: a generation is synchronous, the persons infected
+# in it only spread from the next generation, where the reference lets them spread in the same generation
+# when they come later in `Simulation.persons`. The rumor spreads slower, so the `info` and `average_rate`
+# series are not comparable with the ones of the other engines.
+SYNCHRONOUS_ENGINES = ["tiled"]
+# version of the simulation rules and engines, part of the keys of the result cache (cache.py): bump it
+# whenever a change gives different results for the same parameters and seed.
+ENGINE_VERSION = 1
+# number of uniform random numbers drawn at once by `RandomBuffer`.
+RANDOM_BUFFER_SIZE = 4096
+
+
+def spread_rumor(person):
+    """
+    Spreads a rumor to the given person.
+
+    Args:
+        person (Person): The person to spread the rumor to.
+
+    Returns:
+        int: 1 if the person was successfully infected, 0 otherwise.
+    """
+    if person.state == NON_INFECTED:
+        person.state = INFECTED
+        return 1
+    return 0
 
 
-def create_matrix(rows, cols):
-    """Create a matrix of the specified size with all elements initialized to None.
+def build_neighbour_index(cells, rows, cols):
+    """
+    Build a CSR style index of the occupied neighbours of every person.
+
+    The neighbours of `persons[i]` are `persons[j]` for every `j` in
+    `neighbour_ids[neighbour_offsets[i]:neighbour_offsets[i + 1]]`, listed in `MOVE_SET` order.
 
     Args:
-        rows (int): The number of rows in the matrix.
-        cols (int): The number of columns in the matrix.
+        cells (numpy.ndarray): The flat (row-major) cell index of every person, in `persons` order.
+        rows (int): The number of rows in the grid.
+        cols (int): The number of columns in the grid.
 
     Returns:
-        list: A two-dimensional list representing the matrix.
+        tuple: The `neighbour_offsets` array (one more item than persons) and the flat `neighbour_ids` array.
+    """
+    person_ids = np.full(rows * cols, -1, dtype=np.int64)
+    person_ids[cells] = np.arange(len(cells))
+    person_rows, person_cols = np.divmod(cells, cols)
+    # one column per move, so the valid neighbours of a person come out in MOVE_SET order.
+    neighbours = np.empty((len(cells), len(MOVE_SET)), dtype=np.int64)
+    for k, (row, col) in enumerate(MOVE_SET):
+        neighbours[:, k] = person_ids[(person_rows + row) % rows * cols + (person_cols + col) % cols]
+    occupied = neighbours >= 0
+    neighbour_offsets = array('q', [0])
+    neighbour_offsets.frombytes(np.cumsum(occupied.sum(axis=1), dtype=np.int64).tobytes())
+    neighbour_ids = array('q')
+    neighbour_ids.frombytes(neighbours[occupied].tobytes())
+    return neighbour_offsets, neighbour_ids
+
+
+def draw_skepticism_types(rng, amount, levels, probabilities):
+    """
+    Draw the skepticism level of many persons in one batched categorical draw.
 
+    Args:
+        rng (numpy.random.Generator): The generator used for the draw.
+        amount (int): The number of persons.
+        levels (list): The skepticism levels to choose from.
+        probabilities (list): The (not necessarily normalized) weight of each level.
+
+    Returns:
+        numpy.ndarray: The skepticism level of every person.
     """
-    matrix = []
-    for r in range(rows):
-        row = []
-        for col in range(cols):
-            row.append(None)
-        matrix.append(row)
-    return matrix
+    if amount == 0:
+        return np.empty(0, dtype=np.int8)
+    probabilities = np.asarray(probabilities, dtype=float)
+    total = probabilities.sum()
+    if not total > 0:
+        raise ValueError("cannot draw the skepticism level of %d persons: the probabilities of the levels %s are "
+                         "all 0" % (amount, levels))
+    return rng.choice(np.array(levels, dtype=np.int8), size=amount, p=probabilities / total)
 
 
-def spread_rumor(person_position, matrix):
+def place_population(rng, rows, cols, num_persons, mode, probabilities):
     """
-    Spreads a rumor to a person in the given position of the matrix.
+    Place a new population on the grid, with one spreader, following the rules of the mode.
 
     Args:
-        person_position (tuple): A tuple containing the row and column indexes of the person to spread the rumor to.
-        matrix (list): A 2D list of Person objects representing the population.
+        rng (numpy.random.Generator): The generator used for the draws.
+        rows (int): The number of rows in the grid.
+        cols (int): The number of columns in the grid.
+        num_persons (int): The number of persons to place.
+        mode (str): "fast", "slow" or anything else for the default mode.
+        probabilities (list): The probabilities p_s1, p_s2, p_s3 and p_s4 of the skepticism levels.
 
     Returns:
-        int: 1 if the person in the given position was successfully infected, 0 otherwise.
+        tuple: The cells, skepticism levels and state codes of the persons, as taken by `Simulation.populate`.
     """
-    row = person_position[0]
-    column = person_position[1]
-    if matrix[row][column].state == NON_INFECTED:
-        matrix[row][column].state = INFECTED
-        return 1
-    return 0
+    p_s1, p_s2, p_s3, p_s4 = probabilities
+    cells_amount = rows * cols
+    if mode == "fast":
+        # a block of s1 persons (one of them spreading) on the first cells, s2, s3 and s4 persons around.
+        block_level = 1
+        block_amount = int(num_persons * p_s1)
+        levels, probabilities = [2, 3, 4], [p_s2, p_s3, p_s4]
+    elif mode == "slow":
+        # a block of s3 persons (one of them spreading) on the first cells, s1, s2 and s4 persons around.
+        block_level = 3
+        block_amount = int(num_persons * p_s3)
+        levels, probabilities = [1, 2, 4], [p_s1, p_s2, p_s4]
+    else:
+        block_level = 0
+        block_amount = 0
+        levels, probabilities = [1, 2, 3, 4], [p_s1, p_s2, p_s3, p_s4]
+
+    # one permutation of the free cells places everybody outside of the block.
+    cells = np.empty(num_persons, dtype=np.int64)
+    cells[:block_amount] = np.arange(block_amount)
+    free_cells = rng.permutation(cells_amount - block_amount)[:num_persons - block_amount]
+    cells[block_amount:] = block_amount + free_cells
+    types = np.empty(num_persons, dtype=np.int8)
+    types[:block_amount] = block_level
+    types[block_amount:] = draw_skepticism_types(rng, num_persons - block_amount, levels, probabilities)
+    if block_amount > 0:
+        # like before, the persons of the fast and slow modes are listed in row-major order.
+        cells[block_amount:].sort()
+        spreader = int(rng.integers(block_amount))
+    else:
+        spreader = int(rng.integers(num_persons))
+    states = np.full(num_persons, NON_INFECTED_STATE, dtype=np.int8)
+    states[spreader] = INFECTED_STATE
+    return cells, types, states
 
 
 class Person:
+    # a simulation holds one Person per occupied cell, so keep the instances small: no per instance
+    # __dict__, and the values that are the same for every person live on the class.
+    __slots__ = ("skepticism_level", "state", "position", "stop_spreading_duration",
+                 "original_skepticism_level", "rumors_counter")
+    color_infected = (255, 0, 0)
+    color_not_infected = (0, 255, 0)
+
     def __init__(self, skepticism_level, position, state):
         """
         Initializes a Person object.
@@ -65,233 +176,582 @@ class Person:
         self.skepticism_level = skepticism_level
         self.state = state
         self.position = position
-        self.color_infected = (255, 0, 0)
-        self.color_not_infected = (0, 255, 0)
         self.stop_spreading_duration = 0
-        self.move_set = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
         self.original_skepticism_level = skepticism_level
         self.rumors_counter = 0
 
-    def draw(self, surface, distance):
+    def update(self):
+        """
+        Update the state of the person. If the person is currently in the "stop_spreading" state,
+        decrement the duration of the state. Otherwise, do nothing.
+        """
+        if self.stop_spreading_duration > 0:
+            self.stop_spreading_duration -= 1
+
+
+def spawn_seeds(seed, amount):
+    """
+    Spawn independent seeds for parallel replicates of a simulation.
+
+    Args:
+        seed (int): The seed of the whole experiment.
+        amount (int): The number of replicates.
+
+    Returns:
+        list: One numpy.random.SeedSequence per replicate, usable as the "seed" parameter.
+    """
+    return np.random.SeedSequence(seed).spawn(amount)
+
+
+class RandomBuffer:
+    """
+    Uniform random numbers in [0, 1) drawn from a generator in blocks of `size`.
+
+    The spreading decisions take their numbers one by one with `random` (object engines) or as arrays with
+    `take` (array engines) instead of calling the generator for every contact. Drawing n numbers at once
+    gives the same numbers as n single draws, so the numbers come out in the order of the generator stream.
+
+    Args:
+        rng (numpy.random.Generator): The generator the blocks are drawn from.
+        size (int): The number of values drawn at once.
+    """
+    __slots__ = ("rng", "size", "values", "items", "position", "used_before")
+
+    def __init__(self, rng, size=RANDOM_BUFFER_SIZE):
+        self.rng = rng
+        self.size = size
+        # the current block, `take` returns slices of it.
+        self.values = np.empty(0)
+        # the current block as a list for `random`, built on its first use since python floats are faster to
+        # take one by one than numpy scalars.
+        self.items = None
+        self.position = 0
+        # the numbers handed out before the current block, see `drawn`.
+        self.used_before = 0
+
+    def random(self):
         """
-        Draw the person on the given surface.
+        Return the next number, refilling the buffer when it is exhausted.
+        """
+        items = self.items
+        if items is None or self.position == len(items):
+            items = self.load_items()
+        value = items[self.position]
+        self.position += 1
+        return value
+
+    def load_items(self):
+        """
+        Build the list of the current block for `random`, drawing a new block when it is exhausted.
+        """
+        if self.position == len(self.values):
+            self.used_before += self.position
+            self.values = self.rng.random(self.size)
+            self.values.flags.writeable = False
+            self.position = 0
+        self.items = self.values.tolist()
+        return self.items
+
+    def take(self, amount):
+        """
+        Return the next `amount` numbers as an array, a read only view of the buffer when it holds them.
+        """
+        start = self.position
+        if amount <= len(self.values) - start:
+            self.position += amount
+            return self.values[start:self.position]
+        # what is left in the buffer comes first, the rest is drawn straight from the generator. The result
+        # becomes the current block, so `give_back` can move the position back into it.
+        self.used_before += start
+        self.values = np.concatenate((self.values[start:], self.rng.random(amount - len(self.values) + start)))
+        self.values.flags.writeable = False
+        self.items = None
+        self.position = amount
+        return self.values
+
+    def give_back(self, values):
+        """
+        Put numbers returned by `take` but not used back in front of the buffer.
 
         Args:
-            surface: pygame.Surface object to draw the person on
-            distance: distance between each person on the surface
+            values (numpy.ndarray): The unused tail of the numbers handed out, which may span several `take`
+                calls.
         """
-        if self.state == INFECTED:
-            color = self.color_infected
-        else:
-            color = self.color_not_infected
-        y, x = self.position
-        size = WIDTH // 200
-        pygame.draw.rect(surface, color, (x * distance, y * distance + EXTENSION_FOR_TEXT, size, size))
+        if len(values) <= self.position:
+            self.position -= len(values)
+            return
+        # the numbers handed out before the current block are no longer in it.
+        self.used_before += self.position - len(values)
+        self.values = np.concatenate((values[:len(values) - self.position], self.values))
+        self.values.flags.writeable = False
+        self.items = None
+        self.position = 0
+
+    def drawn(self):
+        """
+        Return the number of numbers handed out (and not given back) so far.
+        """
+        return self.used_before + self.position
 
-    def get_adjacent_positions(self):
+    def remaining(self):
+        """
+        Return the numbers drawn but not used yet, to be restored with `restore`.
         """
-        Get the adjacent positions of the person based on their current position and move set.
+        return self.values[self.position:].tolist()
 
-        Returns:
-            A list of adjacent positions (tuples).
+    def restore(self, values):
+        self.values = np.array(values, dtype=float)
+        self.values.flags.writeable = False
+        self.items = None
+        self.position = 0
+
+
+class StopConditions:
+    """
+    Decides when a running simulation should stop.
+
+    Args:
+        max_generations (int): Stop once this many generations ran (None for no limit).
+        saturation (int): Stop once no new person got infected for this many generations in a row.
+        time_budget (float): Stop once this many seconds of wall-clock time passed since `start`.
+    """
+
+    def __init__(self, max_generations=None, saturation=None, time_budget=None):
+        self.max_generations = max_generations
+        self.saturation = saturation
+        self.time_budget = time_budget
+        self.start_time = time.perf_counter()
+
+    def start(self):
+        """
+        Start counting the time budget from now.
         """
-        r, c = self.position
-        moves = []
-        for row, col in self.move_set:
-            moves.append(((r + row) % ROWS, (c + col) % COLS))
-        return moves
+        self.start_time = time.perf_counter()
 
-    def update(self):
+    def reached(self, simulation):
         """
-        Update the state of the person. If the person is currently in the "stop_spreading" state,
-        decrement the duration of the state. Otherwise, do nothing.
+        Check the stop conditions against the simulation.
+
+        Args:
+            simulation (Simulation): The running simulation.
+
+        Returns:
+            bool: True if any of the conditions is met.
         """
-        if self.stop_spreading_duration > 0:
-            self.stop_spreading_duration -= 1
+        if self.max_generations is not None and simulation.generation >= self.max_generations:
+            return True
+        if self.saturation is not None and simulation.quiet_generations >= self.saturation:
+            return True
+        if self.time_budget is not None and time.perf_counter() - self.start_time >= self.time_budget:
+            return True
+        return False
 
 
 class Simulation:
-    def __init__(self, parameters):
-        self.rows = ROWS
-        self.cols = COLS
+    def __init__(self, parameters, population=None, graph=None):
+        """
+        Initializes a Simulation object.
+
+        Args:
+            parameters (dict): The simulation parameters.
+            population (tuple): Optional (cells, types, states, cooldowns) arrays, as returned by `population`,
+                to start from instead of placing a new population.
+            graph (scipy.sparse.csr_matrix): Optional adjacency matrix for the graph engine, used instead of
+                building the one of the "topology" parameter.
+        """
+        self.parameters = parameters
+        self.rows = parameters.get("rows", ROWS)
+        self.cols = parameters.get("cols", COLS)
         self.generation = 0
         self.infected_persons = 0
-        self.matrix = create_matrix(self.rows, self.cols)
         self.p_population_density = parameters.get("p_population_density")
-        self.num_persons = int(ROWS * COLS * self.p_population_density)
+        self.num_persons = int(self.rows * self.cols * self.p_population_density)
         self.p_s1 = parameters.get("p_s1")
         self.p_s2 = parameters.get("p_s2")
         self.p_s3 = parameters.get("p_s3")
         self.p_s4 = parameters.get("p_s4")
         self.l_generation = parameters.get("l_generation")
         self.mode = parameters.get("mode")
+        # every random draw of the simulation comes from this generator, so the same seed gives the same run.
+        self.seed = parameters.get("seed")
+        self.rng = np.random.default_rng(self.seed)
+        # the spreading decisions draw from this buffer, which is filled from `rng`.
+        self.random_buffer = RandomBuffer(self.rng)
+        self.engine_name = parameters.get("engine", "python")
+        if self.engine_name not in ENGINES:
+            raise ValueError("unknown engine %r, expected one of %s" % (self.engine_name, ENGINES))
+        if self.engine_name == "numba":
+            from numba_engine import NUMBA_AVAILABLE
+            if not NUMBA_AVAILABLE:
+                warnings.warn("numba is not installed (pip install numba), using the python engine instead")
+                self.engine_name = "python"
+        # the adjacency matrix of the graph engine, None for the grid.
+        self.graph = None
+        if self.engine_name == "graph":
+            if graph is None:
+                from graph_engine import load_graph
+                graph = load_graph(parameters, self.num_persons, self.seed)
+            self.graph = graph
+            if self.graph is not None:
+                # every node of a graph is a person, laid out as one row.
+                self.rows, self.cols = 1, self.graph.shape[0]
+                self.num_persons = self.graph.shape[0]
+        # the reference engine works on the Person objects directly, other engines keep their own state.
+        self.engine = None
+        self.matrix = None
         self.persons = []
-        self.info = []
-        self.init_simulation()
-        self.average_rate = []
+        # indexes in `persons` of the persons the reference engine infected in the last generation.
+        self.newly_infected = []
+        self.neighbour_offsets = self.neighbour_ids = None
+        self.cells = None
+        self.renderer = None
+        # metrics sink (see metrics.py) that receives every generation, and how many generations of
+        # `info` and `average_rate` to keep in memory (all of them by default).
+        self.metrics_sink = None
+        # optional per phase timers and counters, see `enable_stats`.
+        self.stats = None
+        # frame recorder (see recorder.py) that captures the state grid after every generation.
+        self.recorder = None
+        self.history_limit = parameters.get("history_limit")
+        self.info = deque(maxlen=self.history_limit) if self.history_limit else []
+        if population is None:
+            self.init_simulation()
+        else:
+            self.populate(*population)
+        if self.engine_name == "frontier":
+            from frontier_engine import FrontierEngine
+            self.engine = FrontierEngine(self)
+        self.average_rate = deque(maxlen=self.history_limit) if self.history_limit else []
+        # persons infected before the first generation kept in `info`, the initial spreaders until the
+        # history limit drops generations.
+        self.infected_before_history = self.infected_persons
+        # generations in a row, up to the last one, in which nobody got infected, even those the history
+        # limit dropped from `info`.
+        self.quiet_generations = 0
+
+    def get_rng_state(self):
+        """
+        Return a copy of the state of the random generator and of the numbers left in `random_buffer`, to
+        be restored with `set_rng_state`.
+        """
+        return {"generator": copy.deepcopy(self.rng.bit_generator.state),
+                "buffer": self.random_buffer.remaining()}
 
-    def add_person(self, position, p_type, state):
+    def set_rng_state(self, state):
+        """
+        Restore the random generator and `random_buffer` to a state returned by `get_rng_state`.
         """
-        Adds a new Person to the matrix at the given position with the given
-        level of skepticism and state.
+        self.rng.bit_generator.state = state["generator"]
+        self.random_buffer.restore(state["buffer"])
+
+    def populate(self, cells, types, states, cooldowns=None):
         """
-        row = position // self.rows
-        col = position % self.cols
-        person = Person(p_type, (row, col), state)
-        self.matrix[row][col] = person
-        self.persons.append(person)
+        Create the population, either as Person objects or as the arrays of an array engine.
+
+        Args:
+            cells (numpy.ndarray): The flat (row-major) cell index of every person.
+            types (numpy.ndarray): The original skepticism level of every person.
+            states (numpy.ndarray): The NON_INFECTED_STATE or INFECTED_STATE code of every person.
+            cooldowns (numpy.ndarray): The stop_spreading_duration of every person, all 0 by default.
+        """
+        self.infected_persons += int(np.count_nonzero(states == INFECTED_STATE))
+        if self.engine_name == "numpy":
+            from numpy_engine import NumpyEngine
+            self.engine = NumpyEngine(self, cells, types, states, cooldowns)
+            return
+        if self.engine_name == "numba":
+            from numba_engine import NumbaEngine
+            self.engine = NumbaEngine(self, cells, types, states, cooldowns)
+            return
+        if self.engine_name == "tiled":
+            from tiled_engine import TiledEngine
+            self.engine = TiledEngine(self, cells, types, states, cooldowns)
+            return
+        if self.engine_name == "graph":
+            from graph_engine import GraphEngine
+            self.engine = GraphEngine(self, cells, types, states, cooldowns)
+            return
+        cols = self.cols
+        self.cells = np.asarray(cells)
+        self.persons = [Person(type_of_person, divmod(position, cols),
+                               INFECTED if state == INFECTED_STATE else NON_INFECTED)
+                        for position, type_of_person, state in zip(cells.tolist(), types.tolist(), states.tolist())]
+        if cooldowns is not None:
+            for i in np.flatnonzero(cooldowns).tolist():
+                self.persons[i].stop_spreading_duration = int(cooldowns[i])
+        matrix = np.full(self.rows * self.cols, None, dtype=object)
+        matrix[cells] = self.persons
+        self.matrix = matrix.reshape(self.rows, self.cols).tolist()
+        self.neighbour_offsets, self.neighbour_ids = build_neighbour_index(self.cells, self.rows, self.cols)
+
+    def population(self):
+        """
+        Return the population as arrays, in the format taken by `populate`.
+
+        Returns:
+            tuple: The cells, original skepticism levels, state codes and cooldowns of every person.
+        """
+        if self.engine_name in ARRAY_ENGINES:
+            return self.engine.population()
+        amount = len(self.persons)
+        types = np.fromiter((person.original_skepticism_level for person in self.persons), dtype=np.int8,
+                            count=amount)
+        states = np.fromiter((person.state == INFECTED for person in self.persons), dtype=np.int8,
+                             count=amount) + NON_INFECTED_STATE
+        cooldowns = np.fromiter((person.stop_spreading_duration for person in self.persons), dtype=np.int32,
+                                count=amount)
+        return self.cells, types, states.astype(np.int8), cooldowns
 
     def init_simulation(self):
-        if self.mode == "fast":
-            s1_person_amount = int(self.num_persons * self.p_s1)
-            ransom_person = random.randint(1, s1_person_amount)
-            for position in range(s1_person_amount):
-                if position == ransom_person:
-                    # spreading person
-                    self.add_person(position, 1, INFECTED)
-                    self.infected_persons += 1
-                else:
-                    self.add_person(position, 1, NON_INFECTED)
-
-            for position in range(s1_person_amount, ROWS * COLS):
-                probabilities = [self.p_s2, self.p_s3, self.p_s4]
-                type_of_person = random.choices(range(2, 5), weights=probabilities)[0]
-                self.add_person(position, type_of_person, NON_INFECTED)
-
-        elif self.mode == "slow":
-            s3_person_amount = int(self.num_persons * self.p_s3)
-            random_person = random.randint(1, s3_person_amount)
-            for position in range(s3_person_amount):
-                if position == random_person:
-                    # spreading person
-                    self.add_person(position, 3, INFECTED)
-                    self.infected_persons += 1
-                else:
-                    self.add_person(position, 3, NON_INFECTED)
-
-            for position in range(s3_person_amount, ROWS * COLS):
-                probabilities = [self.p_s1, self.p_s2, self.p_s4]
-                type_of_person = random.choices(range(1, 4), weights=probabilities)[0]
-                if type_of_person == 3:
-                    type_of_person += 1
-                self.add_person(position, type_of_person, NON_INFECTED)
+        self.populate(*place_population(self.rng, self.rows, self.cols, self.num_persons, self.mode,
+                                        [self.p_s1, self.p_s2, self.p_s3, self.p_s4]))
 
-        else:
-            # getting random numbers to represent the place in the matrix the cell get
-            cells_pos = random.sample(range(self.rows * self.cols), self.num_persons)
-            probabilities = [self.p_s1, self.p_s2, self.p_s3, self.p_s4]
-            random_person = random.choice(cells_pos)
-            for position in cells_pos:
-                type_of_person = random.choices(range(1, 5), weights=probabilities)[0]
-                if position == random_person:
-                    # spreading person
-                    self.add_person(position, type_of_person, INFECTED)
-                    self.infected_persons += 1
-                else:
-                    self.add_person(position, type_of_person, NON_INFECTED)
-
-    def simulate(self, win, large_font, small_font):
-        run = True
-        while run:
-            # making sure the simulation not run to fast
-            time.sleep(0)
+    def simulate(self, win, large_font, small_font, fps=30, generations_per_frame=None, stop=None):
+        """
+        Run the simulation in the pygame window until a stop condition is met.
+
+        The display is refreshed `fps` times per second. Without `generations_per_frame` the simulation
+        advances as many generations as fit between two frames, otherwise exactly that many generations
+        run per frame (and the frame waits for its turn if they finish early).
+
+        Args:
+            win (pygame.Surface): The window surface.
+            large_font (pygame.font.Font): Font for the title, legend and generation number.
+            small_font (pygame.font.Font): Font for the parameters line.
+            fps (int): The number of frames drawn per second.
+            generations_per_frame (int): The number of generations to run between two frames.
+            stop (StopConditions): When to stop, after 151 generations by default.
+
+        Returns:
+            tuple: The `info` and `average_rate` lists.
+        """
+        import pygame
+        if stop is None:
+            stop = StopConditions(max_generations=151)
+        stop.start()
+        frame_time = 1 / fps
+        self.render(win, large_font, small_font)
+        next_frame = time.perf_counter() + frame_time
+        while not stop.reached(self):
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     quit()
+            if generations_per_frame is None:
+                self.update()
+                while time.perf_counter() < next_frame and not stop.reached(self):
+                    self.update()
+            else:
+                for _ in range(generations_per_frame):
+                    self.update()
+                    if stop.reached(self):
+                        break
+                # making sure the display does not refresh faster than fps
+                time.sleep(max(0.0, next_frame - time.perf_counter()))
             self.render(win, large_font, small_font)
-            self.update()
-            if self.generation > 150:
-                run = False
+            next_frame = max(next_frame + frame_time, time.perf_counter())
         return self.info, self.average_rate
 
     def render(self, screen, large_font, small_font):
-        # rendering the screen with white color
-        pygame.draw.rect(screen, WHITE, (0, 0, WIDTH, HEIGHT))
-        # render simulation name
-        simulation_name_text = large_font.render("Simulation Mode : " + self.mode, 1, (100, 100, 100))
-        screen.blit(simulation_name_text, ((WIDTH - simulation_name_text.get_width()) // 2, 0))
-        # how spaces is the headers for each other
-        different = 40
-        x = 0
-        # blit legend to the screen
-        for text, color in HEADERS:
-            text_box = large_font.render(text, 1, color)
-            screen.blit(text_box, (x + different, EXTENSION_FOR_TEXT // 2))
-            x += different + text_box.get_width()
-        # blit generation number to screen
-        gen_text = large_font.render(f"Generation number : {self.generation}", 1, (100, 100, 100))
-        screen.blit(gen_text, ((WIDTH - gen_text.get_width()) // 2, EXTENSION_FOR_TEXT + 200 * (WIDTH // 200)))
-        # blit the parameters to the screen
-        parameters = "population_density: %s, s1: %s, s2: %s, s3: %s, s4: %s L: %s" % \
-                     (self.p_population_density, self.p_s1, self.p_s2, self.p_s3, self.p_s4, self.l_generation)
-        parameters_text = small_font.render(parameters, 1, (100, 100, 100))
-        screen.blit(parameters_text, ((WIDTH - parameters_text.get_width()) // 2, HEIGHT - 50))
-        # rendering each cell into the screen
-        for person in self.persons:
-            person.draw(screen, WIDTH // self.cols)
-        pygame.display.update()
-
-    def get_valid_moves(self, moves):
-        valid = []
-        for move in moves:
-            row, col = move
-            # if it is not None it is mean there is person there.
-            if self.matrix[row][col] is not None:
-                valid.append(move)
-        return valid
+        if self.renderer is None or self.renderer.screen is not screen:
+            from renderer import GridRenderer
+            self.renderer = GridRenderer(self, screen, large_font, small_font)
+        if self.stats is None:
+            self.renderer.render()
+            return
+        start = time.perf_counter()
+        self.renderer.render()
+        self.stats.add_render(time.perf_counter() - start)
+
+    def enable_stats(self, hook=None):
+        """
+        Time the phases of every generation and count the work done in it, see instrumentation.py.
 
-    def update(self):
-        infected_num = 0
-        non_infected_num = 0
-        # creating new empty matrix for the new generation
+        Args:
+            hook (callable): Optional function called as `hook(simulation, record)` after every generation
+                with the timings and counters of that generation.
 
-        for person in self.persons:
+        Returns:
+            SimulationStats: The stats object, also available as `stats`.
+        """
+        from instrumentation import SimulationStats
+        self.stats = SimulationStats(hook)
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    def state_grid(self):
+        """
+        Return the state of every cell.
+
+        Returns:
+            numpy.ndarray: A (rows, cols) array of EMPTY_STATE, NON_INFECTED_STATE and INFECTED_STATE codes.
+        """
+        if self.engine_name in ARRAY_ENGINES:
+            return self.engine.state_grid()
+        state = np.full(self.rows * self.cols, EMPTY_STATE, dtype=np.int8)
+        state[self.cells] = np.fromiter((person.state == INFECTED for person in self.persons), dtype=np.int8,
+                                        count=len(self.persons)) + NON_INFECTED_STATE
+        return state.reshape(self.rows, self.cols)
+
+    def close(self):
+        """
+        Release what the engine holds besides memory, the worker processes of the tiled engine.
+        """
+        if self.engine_name == "tiled":
+            self.engine.close()
+
+    def save_checkpoint(self, path):
+        """
+        Write a checkpoint of the simulation to the directory `path`, see `checkpoint.save_checkpoint`.
+        """
+        from checkpoint import save_checkpoint
+        save_checkpoint(self, path)
+
+    @classmethod
+    def from_checkpoint(cls, path, overrides=None):
+        """
+        Resume a simulation from a checkpoint directory written by `save_checkpoint`.
+
+        Args:
+            path (str): The checkpoint directory.
+            overrides (dict): Parameters to change in the resumed simulation, to fork a what-if branch.
+                With a new "seed" the random stream starts over instead of continuing.
+
+        Returns:
+            Simulation: The resumed simulation.
+        """
+        from checkpoint import load_checkpoint
+        return load_checkpoint(path, overrides)
+
+    def newly_infected_levels(self):
+        """
+        Return how many persons of every original skepticism level got infected in the last generation.
+
+        Returns:
+            numpy.ndarray: The counts, indexed by the skepticism level.
+        """
+        if self.engine is not None:
+            return self.engine.newly_infected_levels()
+        return np.bincount([self.persons[j].original_skepticism_level for j in self.newly_infected],
+                           minlength=len(LEVELS) + 1)
+
+    def history_start(self):
+        """
+        Return where the kept history starts.
+
+        Returns:
+            tuple: The number of the generation of `info[0]` and the number of persons infected before it.
+        """
+        return self.generation - len(self.info) + 1, self.infected_before_history
+
+    def record_generation(self, infected_num, non_infected_num):
+        """
+        Store the outcome of a finished generation in `info` and `average_rate`.
+
+        Args:
+            infected_num (int): The number of persons infected in this generation.
+            non_infected_num (int): The number of spreading attempts that were rejected.
+        """
+        self.infected_persons += infected_num
+        self.generation += 1
+        if self.history_limit and len(self.info) == self.history_limit:
+            # the oldest generation leaves the history.
+            self.infected_before_history += self.info[0]
+        self.info.append(infected_num)
+        self.quiet_generations = 0 if infected_num else self.quiet_generations + 1
+        if (non_infected_num + infected_num) > 0:
+            self.average_rate.append(non_infected_num / (non_infected_num + infected_num))
+        else:
+            self.average_rate.append(0.0)
+        if self.metrics_sink is not None:
+            self.metrics_sink.record(self, infected_num, non_infected_num)
+        if self.recorder is not None:
+            self.recorder.capture(self)
+
+    def update(self):
+        if self.stats is not None:
+            from instrumentation import instrumented_update
+            instrumented_update(self)
+            return
+        if self.engine is not None:
+            infected_num, non_infected_num = self.engine.step()
+            self.record_generation(infected_num, non_infected_num)
+            return
+        self.counting_pass()
+        infected_num, non_infected_num, _ = self.spreading_pass()
+        self.reset_pass()
+        self.record_generation(infected_num, non_infected_num)
+
+    def counting_pass(self):
+        """
+        Count the infected neighbours of every person of the reference engine, lowering the skepticism
+        level of the persons that hear the rumor from two of them.
+        """
+        persons = self.persons
+        offsets = self.neighbour_offsets
+        neighbour_ids = self.neighbour_ids
+        for i, person in enumerate(persons):
             if person.state == NON_INFECTED:
                 continue
-            # gets all the valid moves the cell can go
-            valid_moves = self.get_valid_moves(person.get_adjacent_positions())
-            for valid_move in valid_moves:
-                row = valid_move[0]
-                column = valid_move[1]
-                current_person = self.matrix[row][column]
+            for j in neighbour_ids[offsets[i]:offsets[i + 1]]:
+                current_person = persons[j]
                 current_person.rumors_counter += 1
                 if current_person.rumors_counter == 2:
                     current_person.skepticism_level = max(1, current_person.skepticism_level - 1)
 
-        for person in self.persons:
+    def spreading_pass(self):
+        """
+        Give every infected person of the reference engine its turn to pass the rumor on, in `persons`
+        order. The persons it infects are kept in `newly_infected`.
+
+        Returns:
+            tuple: The number of newly infected persons, the number of rejected spreading attempts and the
+            number of infected persons that were not cooling down when their turn came.
+        """
+        non_infected_num = 0
+        active_spreaders = 0
+        newly_infected = self.newly_infected = []
+        persons = self.persons
+        random_buffer = self.random_buffer
+        offsets = self.neighbour_offsets
+        neighbour_ids = self.neighbour_ids
+        for i, person in enumerate(persons):
             if person.state == NON_INFECTED:
                 continue
-            # gets all the valid moves the cell can go
-            valid_moves = self.get_valid_moves(person.get_adjacent_positions())
-            for valid_move in valid_moves:
+            if person.stop_spreading_duration == 0:
+                active_spreaders += 1
+            for j in neighbour_ids[offsets[i]:offsets[i + 1]]:
                 person_type = person.skepticism_level
                 if person_type == 1 and person.stop_spreading_duration == 0:
-                    infected_num += spread_rumor(valid_move, self.matrix)
+                    if spread_rumor(persons[j]):
+                        newly_infected.append(j)
                     person.stop_spreading_duration = self.l_generation
 
                 elif person_type == 2 and person.stop_spreading_duration == 0:
-                    random_number = random.randint(1, 3)
-                    if random_number == 1 or random_number == 2:
-                        infected_num += spread_rumor(valid_move, self.matrix)
+                    random_number = random_buffer.random()
+                    if random_number < 2 / 3:
+                        if spread_rumor(persons[j]):
+                            newly_infected.append(j)
                         person.stop_spreading_duration = self.l_generation
                     else:
                         non_infected_num += 1
 
                 elif person_type == 3 and person.stop_spreading_duration == 0:
-                    random_number = random.randint(1, 3)
-                    if random_number == 1:
-                        infected_num += spread_rumor(valid_move, self.matrix)
+                    random_number = random_buffer.random()
+                    if random_number < 1 / 3:
+                        if spread_rumor(persons[j]):
+                            newly_infected.append(j)
                         person.stop_spreading_duration = self.l_generation
                     else:
                         non_infected_num += 1
             person.update()
-        self.infected_persons += infected_num
-        self.generation += 1
-        self.info.append(infected_num)
-        if (non_infected_num + infected_num) > 0:
-            self.average_rate.append(non_infected_num / (non_infected_num + infected_num))
-        else:
-            self.average_rate.append(0)
+        return len(newly_infected), non_infected_num, active_spreaders
+
+    def reset_pass(self):
+        """
+        Restore the skepticism levels and the rumors counters of the reference engine.
+        """
         # restart number of rumors counter to 0 after each generation.
         for person in self.persons:
             person.skepticism_level = person.original_skepticism_level
@@ -0,0 +1,140 @@
+"""
+Analysis and plotting of simulation results.
+
+Curves are computed with numpy in linear time and plots are rendered to image files with matplotlib's
+non-interactive Agg canvas, so nothing blocks waiting for a window and it works on servers without a display.
+"""
+import csv
+from collections import defaultdict
+import numpy as np
+
+# z value of a two sided 95% confidence interval of the mean.
+CONFIDENCE_Z = 1.96
+
+
+def cumulative_infected(info, initially_infected=0):
+    """
+    Compute the number of persons that know the rumor after every generation.
+
+    Args:
+        info (list): The number of persons infected in each generation.
+        initially_infected (int): The number of persons that knew the rumor before the first generation.
+
+    Returns:
+        numpy.ndarray: The cumulative number of infected persons per generation.
+    """
+    return np.cumsum(np.asarray(info, dtype=np.int64)) + initially_infected
+
+
+def percent_infected(info, number_of_persons, initially_infected=0):
+    """
+    Compute the percentage of the population that knows the rumor after every generation.
+
+    Args:
+        info (list): The number of persons infected in each generation.
+        number_of_persons (int): The number of persons in the simulation.
+        initially_infected (int): The number of persons that knew the rumor before the first generation.
+
+    Returns:
+        numpy.ndarray: The percentage of infected persons per generation.
+    """
+    return cumulative_infected(info, initially_infected) / number_of_persons * 100
+
+
+def stack_curves(curves):
+    """
+    Stack curves of different lengths into one array, extending the shorter ones with their last value.
+
+    Cumulative curves stay flat after a run stopped, so this is how a stopped replicate continues.
+
+    Args:
+        curves (list): One 1D array per replicate.
+
+    Returns:
+        numpy.ndarray: A (replicates, generations) array.
+    """
+    length = max(len(curve) for curve in curves)
+    stacked = np.empty((len(curves), length))
+    for i, curve in enumerate(curves):
+        stacked[i, :len(curve)] = curve
+        stacked[i, len(curve):] = curve[-1] if len(curve) else 0
+    return stacked
+
+
+def summarize_curves(curves):
+    """
+    Compute the mean curve of many replicates and its 95% confidence band.
+
+    Args:
+        curves (list): One 1D array per replicate.
+
+    Returns:
+        tuple: The mean, lower and upper curves.
+    """
+    stacked = stack_curves(curves)
+    mean = stacked.mean(axis=0)
+    if len(stacked) < 2:
+        return mean, mean, mean
+    margin = CONFIDENCE_Z * stacked.std(axis=0, ddof=1) / np.sqrt(len(stacked))
+    return mean, mean - margin, mean + margin
+
+
+def read_results(path):
+    """
+    Read the curves of a results file written by `rumors run --out` or `rumors sweep`.
+
+    Rows of a sweep are grouped by configuration (every column but task, replicate, seed and the per
+    generation values), a single run is one group with one replicate.
+
+    Args:
+        path (str): The csv file.
+
+    Returns:
+        dict: Maps a configuration label to the list of cumulative infected curves of its replicates.
+    """
+    value_fields = {"task", "replicate", "seed", "generation", "infected", "total_infected", "rejection_rate"}
+    runs = defaultdict(list)
+    labels = {}
+    with open(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        configuration_fields = [field for field in reader.fieldnames if field not in value_fields]
+        for row in reader:
+            task = row.get("task", "0")
+            runs[task].append((int(row["generation"]), int(row["total_infected"])))
+            if task not in labels:
+                labels[task] = ", ".join("%s=%s" % (field, row[field]) for field in configuration_fields)
+    groups = defaultdict(list)
+    for task, points in runs.items():
+        points.sort()
+        groups[labels[task]].append(np.array([total for _, total in points]))
+    return dict(groups)
+
+
+def plot_curves(groups, path, title="", ylabel="Infected population"):
+    """
+    Plot the mean curve and 95% confidence band of every group of replicates to an image file.
+
+    Args:
+        groups (dict): Maps a label to a list of curves (one per replicate).
+        path (str): The image file, the format follows its extension.
+        title (str): The title of the plot.
+        ylabel (str): The label of the y axis.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    for label, curves in groups.items():
+        mean, lower, upper = summarize_curves(curves)
+        generations = np.arange(1, len(mean) + 1)
+        line, = axes.plot(generations, mean, label=label or None)
+        if len(curves) > 1:
+            axes.fill_between(generations, lower, upper, color=line.get_color(), alpha=0.25)
+    axes.set_xlabel("generation")
+    axes.set_ylabel(ylabel)
+    axes.set_title(title)
+    if any(groups):
+        axes.legend(fontsize="small")
+    figure.savefig(path)
@@ -0,0 +1,111 @@
+"""
+Replicates of one configuration advanced together.
+
+`ReplicateBatch` keeps R independent populations stacked in (replicates, persons) arrays, one row per
+replicate in `Simulation.persons` order, and advances all of them with one `cascade_generation` of the numpy
+engine per generation, instead of R separate `Simulation` objects with their own loops. Every replicate has
+its own random stream, spawned from the seed with `spawn_seeds`, so replicate r gives exactly the run of
+`Simulation` with the seed `seeds[r]`.
+
+Example:
+    batch = ReplicateBatch(parameters, replicates=1000, seed=1)
+    info, average_rate = batch.run(150)
+    mean, lower, upper = analysis.summarize_curves(np.cumsum(info, axis=1))
+"""
+import numpy as np
+from Simulator import ROWS, COLS, INFECTED_STATE, RandomBuffer, place_population, spawn_seeds, \
+    build_neighbour_index
+from numpy_engine import DrawStreams, count_heard, effective_skepticism, cascade_generation
+
+
+class ReplicateBatch:
+    """
+    Independent replicates of one configuration in stacked arrays.
+
+    Args:
+        parameters (dict): The simulation parameters, like for `Simulation` (the engine is ignored).
+        replicates (int): The number of replicates.
+        seed (int): The seed the replicate seeds are spawned from, the "seed" parameter by default.
+    """
+
+    def __init__(self, parameters, replicates, seed=None):
+        self.parameters = parameters
+        self.replicates = replicates
+        self.rows = parameters.get("rows", ROWS)
+        self.cols = parameters.get("cols", COLS)
+        self.l_generation = parameters.get("l_generation")
+        num_persons = int(self.rows * self.cols * parameters.get("p_population_density"))
+        probabilities = [parameters.get(name) for name in ["p_s1", "p_s2", "p_s3", "p_s4"]]
+        self.seeds = spawn_seeds(parameters.get("seed") if seed is None else seed, replicates)
+        self.rngs = [np.random.default_rng(replicate_seed) for replicate_seed in self.seeds]
+        self.random_buffers = [RandomBuffer(rng) for rng in self.rngs]
+
+        shape = (replicates, num_persons)
+        self.cells = np.zeros(shape, dtype=np.int64)
+        self.original_skepticism = np.zeros(shape, dtype=np.int8)
+        self.infected = np.zeros(shape, dtype=bool)
+        self.stop_spreading_duration = np.zeros(shape, dtype=np.int32)
+        # the CSR neighbour index of all the replicates, over the flat indexes of the (replicates, persons)
+        # arrays.
+        offsets = [np.zeros(1, dtype=np.int64)]
+        neighbour_ids = []
+        for r, rng in enumerate(self.rngs):
+            cells, types, states = place_population(rng, self.rows, self.cols, num_persons,
+                                                    parameters.get("mode"), probabilities)
+            self.cells[r] = cells
+            self.original_skepticism[r] = types
+            self.infected[r] = states == INFECTED_STATE
+            replicate_offsets, replicate_ids = build_neighbour_index(cells, self.rows, self.cols)
+            offsets.append(np.frombuffer(replicate_offsets, dtype=np.int64)[1:] + offsets[-1][-1])
+            neighbour_ids.append(np.frombuffer(replicate_ids, dtype=np.int64) + r * num_persons)
+        self.neighbour_offsets = np.concatenate(offsets)
+        self.neighbour_ids = np.concatenate(neighbour_ids) if neighbour_ids else np.empty(0, dtype=np.int64)
+
+        self.generation = 0
+        self.infected_persons = np.count_nonzero(self.infected, axis=1)
+        # one array with a value per replicate for every generation.
+        self.info = []
+        self.average_rate = []
+
+    def update(self):
+        """
+        Advance every replicate by one generation.
+        """
+        infected = self.infected.reshape(-1)
+        original_skepticism = self.original_skepticism.reshape(-1)
+        skepticism = effective_skepticism(original_skepticism,
+                                          count_heard(infected, self.neighbour_offsets, self.neighbour_ids))
+        streams = DrawStreams(self.random_buffers, self.l_generation > 0)
+        _, infected_num, non_infected_num, _ = cascade_generation(
+            infected, skepticism, self.stop_spreading_duration.reshape(-1), self.neighbour_offsets,
+            self.neighbour_ids, self.replicates, self.l_generation, streams)
+
+        attempts = infected_num + non_infected_num
+        self.infected_persons += infected_num
+        self.generation += 1
+        self.info.append(infected_num)
+        self.average_rate.append(np.divide(non_infected_num, attempts, out=np.zeros(self.replicates),
+                                           where=attempts > 0))
+
+    def run(self, generations):
+        """
+        Advance every replicate by `generations` generations.
+
+        Returns:
+            tuple: The `results` after the run.
+        """
+        for _ in range(generations):
+            self.update()
+        return self.results()
+
+    def results(self):
+        """
+        Return the per replicate series of the generations run so far.
+
+        Returns:
+            tuple: The (replicates, generations) arrays of newly infected persons and rejection rates, the
+            `info` and `average_rate` of every replicate.
+        """
+        if not self.info:
+            return np.zeros((self.replicates, 0), dtype=np.int64), np.zeros((self.replicates, 0))
+        return np.stack(self.info, axis=1), np.stack(self.average_rate, axis=1)
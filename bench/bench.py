@@ -0,0 +1,253 @@
+"""
+Benchmarks of the simulation.
+
+Times `Simulation.__init__` (which runs `init_simulation`) and `Simulation.update` for every combination of
+grid size, population density, mode and engine, and `Simulation.render` on a headless pygame display as a
+separate case. Every case runs in a fresh process so its peak RSS is its own. The results are written to a
+JSON file so runs from different commits can be compared:
+
+    python bench/bench.py --out bench.json
+    python bench/bench.py --sizes 100 500 --engines numpy frontier --generations 50 --out small.json
+
+A case that runs longer than `--timeout` seconds is stopped and recorded with "timed_out" set, a case that
+fails is recorded with its traceback in "error", and the other cases still run.
+
+The `--warmup` generations (1 by default) run before the timed ones, so the one-off costs of the first
+generation, like the compilation of the numba kernels, are left out of "update_seconds". Their time is
+recorded in "warmup_seconds".
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import sys
+import time
+import traceback
+from multiprocessing import get_context
+
+# render without a window, this has to be set before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from Simulator import Simulation, ENGINES, WIDTH, HEIGHT
+
+SIZES = [100, 500, 1000, 2000]
+DENSITIES = [0.25, 0.5, 0.75]
+MODES = ["fast", "slow", "default"]
+RENDER_ENGINE = "numpy"
+BASE_PARAMETERS = {
+    "p_s1": 0.2,
+    "p_s2": 0.3,
+    "p_s3": 0.4,
+    "p_s4": 0.1,
+    "l_generation": 2,
+}
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process in MB, or None where it cannot be read (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def case_parameters(case):
+    parameters = dict(BASE_PARAMETERS)
+    parameters.update(rows=case["size"], cols=case["size"], p_population_density=case["density"],
+                      mode=case["mode"], engine=case["engine"], seed=case["seed"])
+    return parameters
+
+
+def run_update_case(case):
+    """
+    Time the initialization and `generations` updates of one simulation.
+
+    Args:
+        case (dict): The size, density, mode, engine, seed, warmup and generations of the case.
+
+    Returns:
+        dict: The case with its timings and peak RSS.
+    """
+    start = time.perf_counter()
+    simulation = Simulation(case_parameters(case))
+    init_seconds = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        for _ in range(case["warmup"]):
+            simulation.update()
+        warmup_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(case["generations"]):
+            simulation.update()
+        update_seconds = time.perf_counter() - start
+    finally:
+        simulation.close()
+    return dict(case, persons=simulation.num_persons, init_seconds=init_seconds, warmup_seconds=warmup_seconds,
+                update_seconds=update_seconds,
+                generations_per_second=case["generations"] / update_seconds if update_seconds > 0 else None,
+                infected_persons=simulation.infected_persons, peak_rss_mb=peak_rss_mb())
+
+
+def run_render_case(case):
+    """
+    Time `generations` frames of `Simulation.render` on a headless display, the updates are not timed.
+
+    Args:
+        case (dict): The size, density, mode, engine, seed, warmup and generations of the case.
+
+    Returns:
+        dict: The case with its timings and peak RSS.
+    """
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    large_font = pygame.font.SysFont('comicsans', 35)
+    small_font = pygame.font.SysFont('comicsans', 13)
+    simulation = Simulation(case_parameters(case))
+    render_seconds = 0.0
+    try:
+        for _ in range(case["warmup"]):
+            simulation.update()
+        for _ in range(case["generations"]):
+            simulation.update()
+            start = time.perf_counter()
+            simulation.render(screen, large_font, small_font)
+            render_seconds += time.perf_counter() - start
+    finally:
+        simulation.close()
+        pygame.quit()
+    return dict(case, persons=simulation.num_persons, render_seconds=render_seconds,
+                frames_per_second=case["generations"] / render_seconds if render_seconds > 0 else None,
+                peak_rss_mb=peak_rss_mb())
+
+
+def run_case(case):
+    if case["case"] == "render":
+        return run_render_case(case)
+    return run_update_case(case)
+
+
+def case_process(case, connection):
+    """
+    Body of the process of one case: send back (True, result) or (False, traceback) through `connection`.
+    """
+    # exit normally when the case is stopped, so the simulation is closed and the workers of the tiled
+    # engine are shut down with it.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    try:
+        connection.send((True, run_case(case)))
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+
+
+def run_case_process(case, timeout):
+    """
+    Run a case in a fresh process, so its peak RSS does not include the previous cases.
+
+    Returns:
+        dict: The result of the case, the case with "timed_out" set when it ran longer than `timeout` or
+            with "error" set when it failed.
+    """
+    context = get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=case_process, args=(case, sender))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.terminate()
+            process.join(10)
+            if process.is_alive():
+                process.kill()
+            return dict(case, timed_out=True)
+        try:
+            succeeded, result = receiver.recv()
+        except EOFError:
+            return dict(case, error="the process exited with code %s" % process.exitcode)
+        if not succeeded:
+            return dict(case, error=result)
+        return result
+    finally:
+        receiver.close()
+        process.join()
+
+
+def build_cases(args):
+    common = {"seed": args.seed, "warmup": args.warmup, "generations": args.generations}
+    cases = []
+    for size in args.sizes:
+        for density in args.densities:
+            for mode in args.modes:
+                for engine in args.engines:
+                    cases.append(dict(common, case="update", size=size, density=density, mode=mode, engine=engine))
+    if not args.no_render:
+        for size in args.sizes:
+            cases.append(dict(common, case="render", size=size, density=args.densities[-1], mode=args.modes[0],
+                              engine=RENDER_ENGINE))
+    return cases
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the rumors simulation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="side lengths of the square grids")
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES, help="population densities")
+    parser.add_argument("--modes", nargs="+", default=MODES, help="simulation modes")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES, help="engines to time")
+    parser.add_argument("--generations", type=int, default=20, help="number of timed generations per case")
+    parser.add_argument("--warmup", type=int, default=1, help="number of untimed generations before timing")
+    parser.add_argument("--seed", type=int, default=1, help="seed of every simulation")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="seconds a case may run before it is stopped and recorded as timed out")
+    parser.add_argument("--no-render", action="store_true", help="skip the headless render cases")
+    parser.add_argument("--out", default="bench.json", help="json file to write the results to")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = []
+    for case in build_cases(args):
+        result = run_case_process(case, args.timeout)
+        results.append(result)
+        if result.get("timed_out"):
+            print("%s %s %dx%d density %s %s: timed out after %ss" % (result["case"], result["engine"],
+                                                                      result["size"], result["size"],
+                                                                      result["density"], result["mode"],
+                                                                      args.timeout))
+        elif result.get("error"):
+            print("%s %s %dx%d density %s %s: failed\n%s" % (result["case"], result["engine"], result["size"],
+                                                            result["size"], result["density"], result["mode"],
+                                                            result["error"]))
+        elif result["case"] == "render":
+            print("render %dx%d: %.1f frames/s, %.0f MB" % (result["size"], result["size"],
+                                                             result["frames_per_second"] or 0,
+                                                             result["peak_rss_mb"] or 0))
+        else:
+            print("%s %dx%d density %s %s: init %.3fs, %.2f generations/s, %.0f MB" %
+                  (result["engine"], result["size"], result["size"], result["density"], result["mode"],
+                   result["init_seconds"], result["generations_per_second"] or 0, result["peak_rss_mb"] or 0))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("results written to %s" % args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+On-disk cache of finished simulation runs.
+
+A run is addressed by the hash of everything its results depend on: the normalized parameters, the seed,
+`ENGINE_VERSION`, the number of generations and, for an edge list topology, the contents of the edge file.
+Every entry is one .npz file named by that hash, holding the `info` and `average_rate` series and summary
+statistics of the run. Reading an entry marks it as used, and when the cache grows over its size limit the
+least recently used entries are deleted.
+
+Only seeded runs are cached: without an int seed a run cannot be repeated, so `key` returns None.
+
+Example:
+    cache = ResultCache(".rumors_cache")
+    initial_infected, info, average_rate = cached_run(parameters, 150, cache)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from Simulator import Simulation, ROWS, COLS, ENGINE_VERSION
+
+DEFAULT_CACHE_SIZE = 1024 ** 3
+# parameters that do not change the results of a seed, left out of the keys.
+IGNORED_PARAMETERS = ["seed", "name", "history_limit", "workers", "start_method", "step_timeout"]
+# defaults filled in before hashing, so leaving a parameter out and setting its default share an entry.
+PARAMETER_DEFAULTS = {"rows": ROWS, "cols": COLS, "engine": "python"}
+
+
+def normalize(value):
+    """
+    Return a value with the floats rounded and the numpy scalars converted, so equal parameters that went
+    through different arithmetic (like normalized sampled probabilities) hash the same.
+    """
+    if isinstance(value, dict):
+        return {str(name): normalize(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 12)
+    return value
+
+
+def summarize_run(initial_infected, info, average_rate):
+    """
+    Compute the summary statistics stored with a run.
+
+    Returns:
+        dict: The initially infected and total infected persons, the generation with the most new
+        infections and their number, and the mean rejection rate.
+    """
+    info = np.asarray(info, dtype=np.int64)
+    peak = int(np.argmax(info)) if len(info) else -1
+    return {
+        "generations": len(info),
+        "initial_infected": int(initial_infected),
+        "total_infected": int(initial_infected + info.sum()),
+        "peak_generation": peak + 1,
+        "peak_infected": int(info[peak]) if len(info) else 0,
+        "mean_rejection_rate": float(np.mean(average_rate)) if len(average_rate) else 0.0,
+    }
+
+
+class ResultCache:
+    """
+    A directory of cached runs, evicted least recently used first.
+
+    Args:
+        path (str): The cache directory, created when missing.
+        max_size (int): The size limit of the entries in bytes.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+        # the size of the entries, only measured when the first entry is added.
+        self.size = None
+        # the digests of the edge files, by path, size and modification time, so a file is read once.
+        self.file_digests = {}
+
+    def key(self, parameters, generations):
+        """
+        Return the hash addressing the run of `parameters` for `generations` generations, None when the
+        parameters have no int seed.
+        """
+        seed = parameters.get("seed")
+        if not isinstance(seed, (int, np.integer)) or isinstance(seed, bool):
+            return None
+        normalized = dict(PARAMETER_DEFAULTS)
+        normalized.update((name, value) for name, value in parameters.items() if name not in IGNORED_PARAMETERS)
+        content = {"parameters": normalize(normalized), "seed": int(seed), "engine_version": ENGINE_VERSION,
+                   "generations": int(generations)}
+        if "topology" in parameters:
+            # graph_engine imports scipy, only needed for runs that pick a topology.
+            from graph_engine import topology_spec
+            spec = topology_spec(parameters)
+        else:
+            spec = {"type": "grid"}
+        if spec["type"] == "edges":
+            # the same path may hold a different graph between runs.
+            content["edges"] = self.file_digest(spec["path"])
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def file_digest(self, path):
+        """
+        Return the sha256 hex digest of the contents of the file `path`.
+        """
+        stat = os.stat(path)
+        signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if signature not in self.file_digests:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self.file_digests[signature] = digest.hexdigest()
+        return self.file_digests[signature]
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def get(self, parameters, generations):
+        """
+        Return the cached run of `parameters` for `generations` generations.
+
+        Returns:
+            dict: The "info" and "average_rate" lists and the "summary" dict of the run, None when it is not
+            cached.
+        """
+        key = self.key(parameters, generations)
+        if key is None:
+            return None
+        path = self.entry_path(key)
+        try:
+            with np.load(path) as entry:
+                result = {"info": entry["info"].tolist(), "average_rate": entry["average_rate"].tolist(),
+                          "summary": json.loads(str(entry["summary"]))}
+        except (OSError, ValueError, KeyError):
+            # a missing entry, or one evicted or broken by another process.
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, parameters, generations, initial_infected, info, average_rate):
+        """
+        Store a finished run, then evict the least recently used entries if the cache is over its limit.
+
+        Args:
+            parameters (dict): The simulation parameters, with the seed.
+            generations (int): The number of generations run.
+            initial_infected (int): The number of persons infected before the first generation.
+            info (list): The newly infected persons of every generation.
+            average_rate (list): The rejection rate of every generation.
+        """
+        key = self.key(parameters, generations)
+        if key is None:
+            return
+        summary = summarize_run(initial_infected, info, average_rate)
+        # written to a temporary file first, so readers never see a partial entry.
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix=".tmp", delete=False) as f:
+            np.savez(f, info=np.asarray(info, dtype=np.int64), average_rate=np.asarray(average_rate, dtype=float),
+                     summary=np.array(json.dumps(summary)))
+        path = self.entry_path(key)
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(f.name, path)
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += os.path.getsize(path) - replaced
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """
+        Return the (path, size, last use) of every entry.
+        """
+        entries = []
+        with os.scandir(self.path) as scan:
+            for item in scan:
+                if item.name.endswith(".npz"):
+                    stat = item.stat()
+                    entries.append((item.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache is within its size limit.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+
+def cached_run(parameters, generations, cache):
+    """
+    Return the results of running `parameters` for `generations` generations, from the cache when the run
+    is there and by running the simulation (and caching it) otherwise.
+
+    Returns:
+        tuple: The number of initially infected persons and the `info` and `average_rate` lists.
+    """
+    result = cache.get(parameters, generations)
+    if result is not None:
+        return result["summary"]["initial_infected"], result["info"], result["average_rate"]
+    # the whole series is cached, whatever the history limit of the parameters.
+    simulation = Simulation(dict(parameters, history_limit=None))
+    try:
+        for _ in range(generations):
+            simulation.update()
+    finally:
+        simulation.close()
+    _, initial_infected = simulation.history_start()
+    info, average_rate = list(simulation.info), list(simulation.average_rate)
+    cache.put(parameters, generations, initial_infected, info, average_rate)
+    return initial_infected, info, average_rate
@@ -0,0 +1,147 @@
+"""
+Binary checkpoints of a running simulation.
+
+A checkpoint is a directory with one .npy file per array, so the population can be memory-mapped when
+it is loaded again, and a meta.json file with the parameters, the generation counters and the state of
+the random generator:
+
+    cells.npy          flat (row-major) cell index of every person, this is the grid occupancy
+    types.npy          original skepticism level of every person
+    states.npy         NON_INFECTED_STATE or INFECTED_STATE code of every person
+    cooldowns.npy      stop_spreading_duration of every person
+    info.npy           the `info` history
+    average_rate.npy   the `average_rate` history
+    graph_indptr.npy   the CSR index pointers of the adjacency matrix of a graph topology
+    graph_indices.npy  the CSR column indices of the adjacency matrix of a graph topology
+    meta.json
+
+Checkpoints are taken between generations, when the rumors counters are all 0, so they are not stored.
+
+The graph files are only written for the graph engine on a graph topology. A generated graph depends on the
+seed and an edge list on a file that may change, so the resumed simulation uses the saved graph instead of
+building it again, unless the overrides change the "topology" or "topology_seed" parameters.
+
+The seed is kept as an int, or as the entropy and spawn key of a numpy.random.SeedSequence such as the ones
+of `spawn_seeds`, since the tiled engine and generated graphs derive their streams from it.
+"""
+import json
+import os
+import shutil
+import numpy as np
+from Simulator import Simulation
+
+CHECKPOINT_FORMAT = 2
+POPULATION_FILES = ["cells", "types", "states", "cooldowns"]
+GRAPH_FILES = ["graph_indptr", "graph_indices"]
+META_FILE = "meta.json"
+
+
+def encode_seed(seed):
+    """
+    Return the "seed" parameter as a JSON value: an int, the entropy and spawn key of a SeedSequence or None.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        entropy = seed.entropy
+        entropy = int(entropy) if isinstance(entropy, (int, np.integer)) else [int(value) for value in entropy]
+        return {"entropy": entropy, "spawn_key": [int(value) for value in seed.spawn_key]}
+    if isinstance(seed, (int, np.integer)) and not isinstance(seed, bool):
+        return int(seed)
+    return None
+
+
+def decode_seed(value):
+    """
+    Return the "seed" parameter stored by `encode_seed`.
+    """
+    if isinstance(value, dict):
+        return np.random.SeedSequence(value["entropy"], spawn_key=tuple(value["spawn_key"]))
+    return value
+
+
+def save_checkpoint(simulation, path):
+    """
+    Write a checkpoint of the simulation to the directory `path`.
+
+    The checkpoint is written next to `path` first and moved in place when it is complete, so a run
+    that dies while writing keeps its previous checkpoint.
+
+    Args:
+        simulation (Simulation): The simulation to save.
+        path (str): The checkpoint directory, replaced if it exists.
+    """
+    temporary_path = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    for name, values in zip(POPULATION_FILES, simulation.population()):
+        np.save(os.path.join(temporary_path, name + ".npy"), np.ascontiguousarray(values))
+    np.save(os.path.join(temporary_path, "info.npy"), np.array(simulation.info, dtype=np.int64))
+    np.save(os.path.join(temporary_path, "average_rate.npy"), np.array(simulation.average_rate, dtype=np.float64))
+    if simulation.graph is not None:
+        for name, values in zip(GRAPH_FILES, (simulation.graph.indptr, simulation.graph.indices)):
+            np.save(os.path.join(temporary_path, name + ".npy"), values)
+    meta = {
+        "format": CHECKPOINT_FORMAT,
+        "parameters": {name: value for name, value in simulation.parameters.items() if name != "seed"},
+        "seed": encode_seed(simulation.seed),
+        "generation": simulation.generation,
+        "infected_persons": simulation.infected_persons,
+        "infected_before_history": simulation.infected_before_history,
+        "quiet_generations": simulation.quiet_generations,
+        "rng_state": simulation.get_rng_state(),
+    }
+    with open(os.path.join(temporary_path, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    old_path = path.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(temporary_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_checkpoint(path, overrides=None, mmap_mode="r"):
+    """
+    Resume a simulation from a checkpoint directory.
+
+    Args:
+        path (str): The checkpoint directory.
+        overrides (dict): Parameters to change in the resumed simulation. With a new "seed" the random
+            stream starts over instead of continuing from the saved state.
+        mmap_mode (str): How to open the population and graph arrays, memory-mapped read-only by default.
+
+    Returns:
+        Simulation: The resumed simulation.
+    """
+    with open(os.path.join(path, META_FILE), 'r') as f:
+        meta = json.load(f)
+    if meta["format"] != CHECKPOINT_FORMAT:
+        raise ValueError("unsupported checkpoint format %r in %s" % (meta["format"], path))
+    parameters = dict(meta["parameters"])
+    parameters["seed"] = decode_seed(meta["seed"])
+    overrides = overrides or {}
+    parameters.update(overrides)
+    population = tuple(np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in POPULATION_FILES)
+    graph = None
+    graph_paths = [os.path.join(path, name + ".npy") for name in GRAPH_FILES]
+    if all(os.path.exists(graph_path) for graph_path in graph_paths) and \
+            "topology" not in overrides and "topology_seed" not in overrides:
+        from graph_engine import adjacency_from_csr
+        graph = adjacency_from_csr(*(np.load(graph_path, mmap_mode=mmap_mode) for graph_path in graph_paths))
+
+    simulation = Simulation(parameters, population=population, graph=graph)
+    simulation.generation = meta["generation"]
+    simulation.infected_persons = meta["infected_persons"]
+    info = np.load(os.path.join(path, "info.npy")).tolist()
+    # a smaller history limit in the overrides drops the oldest saved generations.
+    dropped = len(info) - min(len(info), simulation.history_limit or len(info))
+    simulation.infected_before_history = meta.get("infected_before_history",
+                                                  meta["infected_persons"] - sum(info)) + sum(info[:dropped])
+    simulation.info.extend(info)
+    # older checkpoints did not store the counter, the trailing zeros of the saved history are a lower bound.
+    simulation.quiet_generations = meta.get("quiet_generations",
+                                            len(info) - len(np.trim_zeros(np.array(info, dtype=np.int64), "b")))
+    simulation.average_rate.extend(np.load(os.path.join(path, "average_rate.npy")).tolist())
+    if "seed" not in overrides:
+        simulation.set_rng_state(meta["rng_state"])
+    return simulation
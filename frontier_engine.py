@@ -0,0 +1,120 @@
+import heapq
+import numpy as np
+from Simulator import INFECTED, LEVELS, spread_rumor
+
+
+class FrontierEngine:
+    """
+    Incremental engine for `Simulation.update` that only visits the persons that can change.
+
+    It keeps the infected persons whose `stop_spreading_duration` is 0 (the active spreaders) and the
+    infected persons that are still cooling down. The rumors counter is only computed for the persons
+    that spread, and those are remembered in a dirty list so resetting the counters at the end of the
+    generation does not scan the whole population. A generation costs time proportional to the number
+    of infected persons that are active or cooling down instead of the population size.
+
+    The spreaders are visited in `Simulation.persons` order, including persons infected earlier in the
+    same generation, so the random numbers are drawn in the same order as the reference engine and the
+    results are identical for the same seed.
+    """
+
+    def __init__(self, simulation):
+        """
+        Build the active and cooling sets from the persons created by `Simulation.init_simulation`.
+
+        Args:
+            simulation (Simulation): The simulation this engine advances.
+        """
+        self.simulation = simulation
+        self.l_generation = simulation.l_generation
+        self.active = set()
+        self.cooling = set()
+        # the persons infected in the last generation.
+        self.newly_infected = set()
+        for i, person in enumerate(simulation.persons):
+            if person.state == INFECTED:
+                if person.stop_spreading_duration == 0:
+                    self.active.add(i)
+                else:
+                    self.cooling.add(i)
+
+    def step(self):
+        """
+        Advance the population by one generation.
+
+        Returns:
+            tuple: The number of newly infected persons and the number of rejected spreading attempts.
+        """
+        persons = self.simulation.persons
+        random_buffer = self.simulation.random_buffer
+        offsets = self.simulation.neighbour_offsets
+        neighbour_ids = self.simulation.neighbour_ids
+        infected_num = 0
+        non_infected_num = 0
+        newly_infected = self.newly_infected = set()
+        dirty = []
+        spreaders = sorted(self.active)
+        self.active = set()
+        # persons cooling down at the start of the generation cannot spread, only their cooldown changes.
+        cooling = self.cooling
+        self.cooling = set()
+        for i in cooling:
+            persons[i].update()
+            if persons[i].stop_spreading_duration > 0:
+                self.cooling.add(i)
+            else:
+                self.active.add(i)
+
+        while spreaders:
+            i = heapq.heappop(spreaders)
+            person = persons[i]
+            neighbours = neighbour_ids[offsets[i]:offsets[i + 1]]
+            # the rumors counter only counts the persons that were infected at the start of the generation.
+            person.rumors_counter = sum(1 for j in neighbours if persons[j].state == INFECTED and
+                                        j not in newly_infected)
+            if person.rumors_counter >= 2:
+                person.skepticism_level = max(1, person.skepticism_level - 1)
+            dirty.append(person)
+
+            person_type = person.skepticism_level
+            for j in neighbours:
+                if person_type == 4 or person.stop_spreading_duration != 0:
+                    break
+                if person_type == 2:
+                    random_number = random_buffer.random()
+                    if random_number >= 2 / 3:
+                        non_infected_num += 1
+                        continue
+                elif person_type == 3:
+                    random_number = random_buffer.random()
+                    if random_number >= 1 / 3:
+                        non_infected_num += 1
+                        continue
+                person.stop_spreading_duration = self.l_generation
+                if spread_rumor(persons[j]):
+                    infected_num += 1
+                    newly_infected.add(j)
+                    # persons later in the list already spread in this generation, like in the reference engine.
+                    if j > i:
+                        heapq.heappush(spreaders, j)
+                    else:
+                        self.active.add(j)
+            person.update()
+            if person.stop_spreading_duration > 0:
+                self.cooling.add(i)
+            else:
+                self.active.add(i)
+
+        # restart number of rumors counter to 0 for the persons that were touched.
+        for person in dirty:
+            person.skepticism_level = person.original_skepticism_level
+            person.rumors_counter = 0
+        return infected_num, non_infected_num
+
+    def newly_infected_levels(self):
+        """
+        Return how many persons of every original skepticism level got infected in the last generation.
+        """
+        persons = self.simulation.persons
+        return np.bincount([persons[j].original_skepticism_level for j in self.newly_infected],
+                           minlength=len(LEVELS) + 1)
@@ -0,0 +1,185 @@
+"""
+Engine for `Simulation.update` on any network of persons, needs scipy (pip install scipy).
+
+The neighbourhood is a sparse adjacency matrix in CSR format, selected with the "topology" parameter:
+
+    topology: grid                                                  the 8 neighbours on the toroidal grid
+    topology: {type: edges, path: network.txt}                      an edge list file, one "u v" pair per line
+    topology: {type: small_world, nodes: 10000, k: 6, p: 0.1}       a Watts-Strogatz small world graph
+    topology: {type: scale_free, nodes: 10000, m: 3}                a Barabasi-Albert scale free graph
+
+Edges are undirected, self loops are dropped and duplicate edges are merged. On a graph every node is a
+person (the population density does not apply) and the nodes are laid out as one row of the grid. Random
+graphs are generated from the simulation seed, so a seed always gives the same graph.
+
+A generation is the one of the numpy engine on the neighbours of the topology: the persons take their turns
+in `Simulation.persons` order, a person infected earlier in the generation spreads in the same one, and a
+spreader tries its neighbours in the order of its CSR row. On the grid topology the neighbours are the ones
+of `build_neighbour_index`, so a run gives exactly the results of the `python` engine for the same seed.
+"""
+import numpy as np
+from numpy_engine import NumpyEngine
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+TOPOLOGIES = ["grid", "edges", "small_world", "scale_free"]
+# spawn key of the generator that builds random graphs, apart from the stream of the simulation.
+TOPOLOGY_KEY = 1
+
+
+def topology_spec(parameters):
+    """
+    Return the "topology" parameter as a dict with a "type" key.
+    """
+    spec = parameters.get("topology", "grid")
+    if isinstance(spec, str):
+        spec = {"type": spec}
+    if spec.get("type") not in TOPOLOGIES:
+        raise ValueError("unknown topology %r, expected one of %s" % (spec.get("type"), TOPOLOGIES))
+    return spec
+
+
+def adjacency_matrix(sources, targets, nodes):
+    """
+    Build the symmetric CSR adjacency matrix of undirected edges, without self loops or duplicate edges.
+    """
+    if sparse is None:
+        raise ImportError("the graph engine needs scipy: pip install scipy")
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    rows = np.concatenate((sources, targets))
+    cols = np.concatenate((targets, sources))
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(nodes, nodes))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def read_edge_list(path, nodes=None):
+    """
+    Read an edge list file: one pair of 0-based node ids per line, separated by spaces, tabs or a comma,
+    with "#" starting a comment.
+
+    Args:
+        path (str): The file.
+        nodes (int): The number of nodes, one more than the largest id in the file by default.
+    """
+    with open(path, 'r') as f:
+        lines = (line.split("#", 1)[0].replace(",", " ") for line in f)
+        edges = np.loadtxt(lines, dtype=np.int64, ndmin=2)
+    if edges.size == 0:
+        edges = edges.reshape(0, 2)
+    if nodes is None:
+        nodes = int(edges.max()) + 1 if len(edges) else 0
+    return adjacency_matrix(edges[:, 0], edges[:, 1], nodes)
+
+
+def small_world_graph(nodes, k, p, rng):
+    """
+    Generate a Watts-Strogatz graph: a ring where every node is linked to its k nearest nodes, then the
+    far end of every edge is moved to a random node with probability p.
+    """
+    if not 0 < k < nodes:
+        raise ValueError("a small world graph needs 0 < k < nodes, got k=%s for %s nodes" % (k, nodes))
+    sources = np.repeat(np.arange(nodes, dtype=np.int64), k // 2)
+    targets = (sources + np.tile(np.arange(1, k // 2 + 1), nodes)) % nodes
+    rewired = rng.random(len(targets)) < p
+    targets[rewired] = rng.integers(nodes, size=int(np.count_nonzero(rewired)))
+    return adjacency_matrix(sources, targets, nodes)
+
+
+def scale_free_graph(nodes, m, rng):
+    """
+    Generate a Barabasi-Albert graph: every new node links to m existing nodes picked with probability
+    proportional to their degree, starting from a star of m + 1 nodes.
+    """
+    if not 0 < m < nodes:
+        raise ValueError("a scale free graph needs 0 < m < nodes, got m=%s for %s nodes" % (m, nodes))
+    sources = np.repeat(np.arange(m, nodes, dtype=np.int64), m)
+    targets = np.empty(len(sources), dtype=np.int64)
+    targets[:m] = np.arange(m)
+    # every node appears in `repeated` once per edge end, so a uniform pick in it is a pick by degree.
+    repeated = np.empty(2 * len(sources), dtype=np.int64)
+    repeated[0::2] = sources
+    repeated[1:2 * m:2] = targets[:m]
+    draws = rng.random((nodes - m - 1, m))
+    for i in range(nodes - m - 1):
+        edges = slice(m * (i + 1), m * (i + 2))
+        # the picks of a node are all made before its own edges are added, duplicates are merged later.
+        targets[edges] = repeated[(draws[i] * 2 * m * (i + 1)).astype(np.int64)]
+        repeated[2 * edges.start + 1:2 * edges.stop:2] = targets[edges]
+    return adjacency_matrix(sources, targets, nodes)
+
+
+def topology_generator(seed):
+    """
+    Return the generator random graphs are built with, derived from the simulation seed.
+    """
+    sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return np.random.default_rng(np.random.SeedSequence(sequence.entropy,
+                                                        spawn_key=sequence.spawn_key + (TOPOLOGY_KEY,)))
+
+
+def load_graph(parameters, num_persons, seed):
+    """
+    Build the adjacency matrix of the "topology" parameter.
+
+    Args:
+        parameters (dict): The simulation parameters.
+        num_persons (int): The number of nodes of generated graphs when the topology does not set "nodes".
+        seed: The simulation seed.
+
+    Returns:
+        scipy.sparse.csr_matrix: The adjacency matrix, None for the grid topology whose neighbours depend
+        on where the persons are placed.
+    """
+    spec = topology_spec(parameters)
+    if spec["type"] == "grid":
+        return None
+    if spec["type"] == "edges":
+        return read_edge_list(spec["path"], spec.get("nodes"))
+    nodes = spec.get("nodes", num_persons)
+    rng = topology_generator(parameters.get("topology_seed", seed))
+    if spec["type"] == "small_world":
+        return small_world_graph(nodes, spec.get("k", 8), spec.get("p", 0.1), rng)
+    return scale_free_graph(nodes, spec.get("m", 4), rng)
+
+
+class GraphEngine(NumpyEngine):
+    """
+    Engine for `Simulation.update` on the adjacency matrix of the topology.
+
+    The population is kept as the arrays of the numpy engine, with the neighbour index of the graph instead
+    of the grid one when the topology is a graph.
+    """
+
+    def neighbour_index(self, simulation):
+        """
+        Return the CSR index of the neighbours of the persons, see `NumpyEngine.neighbour_index`.
+        """
+        graph = simulation.graph
+        if graph is None:
+            return super().neighbour_index(simulation)
+        # person i is the node cells[i], its neighbours are the persons of the nodes in its row of the graph.
+        person_ids = np.empty(graph.shape[0], dtype=np.int64)
+        person_ids[self.cells] = np.arange(len(self.cells))
+        starts = graph.indptr[self.cells].astype(np.int64)
+        degree = graph.indptr[self.cells + 1] - starts
+        offsets = np.zeros(len(self.cells) + 1, dtype=np.int64)
+        np.cumsum(degree, out=offsets[1:])
+        edges = np.repeat(starts - offsets[:-1], degree) + np.arange(offsets[-1])
+        return offsets, person_ids[graph.indices[edges]]
+
+
+def adjacency_from_csr(indptr, indices):
+    """
+    Build the adjacency matrix of the CSR `indptr` and `indices` arrays of a square matrix, as saved by a
+    checkpoint.
+    """
+    if sparse is None:
+        raise ImportError("the graph engine needs scipy: pip install scipy")
+    nodes = len(indptr) - 1
+    return sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(nodes, nodes))
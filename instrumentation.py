@@ -0,0 +1,182 @@
+"""
+Optional instrumentation of a simulation.
+
+`Simulation.enable_stats` attaches a `SimulationStats` object that times the phases of every generation and
+counts the work done in it. The passes are the same methods `Simulation.update` runs without a stats
+object, untimed, so the instrumentation costs nothing when it is disabled.
+
+Phases (seconds):
+    counting    the pass counting the infected neighbours of every person
+    spreading   the pass where the active spreaders pass the rumor on
+    reset       the pass restoring the rumors counters and skepticism levels
+    step        a whole generation of an engine that does not report its passes separately (frontier, numba,
+                tiled)
+    render      `Simulation.render`, which runs between generations
+
+Counters (per generation):
+    active_spreaders    infected persons that were not cooling down when their turn came
+    neighbour_probes    neighbours looked at in the counting and spreading passes, the reference engine counts
+                        its spreading pass over the persons infected at the end of the generation
+    rng_draws           random numbers drawn from `Simulation.random_buffer`, the tiled engine draws from the
+                        streams of its workers and does not report them
+
+A counter an engine cannot report is None in the per generation record.
+"""
+import time
+import numpy as np
+from Simulator import NON_INFECTED
+
+PHASES = ["counting", "spreading", "reset", "step", "render"]
+COUNTERS = ["active_spreaders", "neighbour_probes", "rng_draws"]
+
+
+class SimulationStats:
+    """
+    Per phase timers and counters of a simulation.
+
+    Args:
+        hook (callable): Optional function called as `hook(simulation, record)` after every generation, where
+            `record` is the dict stored in `last`.
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.generations = 0
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        # totals of the counters, None while the engine did not report them.
+        self.counters = dict.fromkeys(COUNTERS)
+        # the record of the last generation: its number, the seconds of each phase and the counters.
+        self.last = {}
+
+    def add_render(self, seconds):
+        self.phase_seconds["render"] += seconds
+
+    def record_generation(self, simulation, seconds, counters):
+        """
+        Add the phase timings and counters of the generation the simulation just finished.
+
+        Args:
+            simulation (Simulation): The simulation, after `record_generation` counted the generation.
+            seconds (dict): The seconds spent in every phase of the generation.
+            counters (dict): The counters of the generation, None for the ones that are not known.
+        """
+        self.generations += 1
+        for phase, value in seconds.items():
+            self.phase_seconds[phase] += value
+        for name, value in counters.items():
+            if value is not None:
+                self.counters[name] = (self.counters[name] or 0) + value
+        self.last = {"generation": simulation.generation}
+        self.last.update(seconds)
+        self.last.update(counters)
+        if self.hook is not None:
+            self.hook(simulation, self.last)
+
+    def report(self):
+        """
+        Return a text table of the total time of every phase and the totals of the counters.
+        """
+        total = sum(self.phase_seconds.values())
+        lines = ["%d generations" % self.generations]
+        for phase in PHASES:
+            seconds = self.phase_seconds[phase]
+            if seconds > 0:
+                lines.append("  %-18s %10.4fs %6.1f%%" % (phase, seconds, 100 * seconds / total))
+        for name in COUNTERS:
+            value = self.counters[name]
+            lines.append("  %-18s %12s" % (name, "n/a" if value is None else value))
+        return "\n".join(lines)
+
+
+def instrumented_update(simulation):
+    """
+    Advance the simulation by one generation, like `Simulation.update`, and record its stats.
+
+    The reference engine and the numpy and graph engines are timed pass by pass, the other engines as a whole
+    step.
+
+    Args:
+        simulation (Simulation): The simulation, with `stats` set.
+    """
+    if simulation.engine_name in ("numpy", "graph"):
+        seconds, counters, infected_num, non_infected_num = numpy_generation(simulation.engine)
+    elif simulation.engine is not None:
+        active_spreaders = len(simulation.engine.active) if simulation.engine_name == "frontier" else None
+        drawn = simulation.random_buffer.drawn()
+        start = time.perf_counter()
+        infected_num, non_infected_num = simulation.engine.step()
+        seconds = {"step": time.perf_counter() - start}
+        rng_draws = None if simulation.engine_name == "tiled" else simulation.random_buffer.drawn() - drawn
+        counters = {"active_spreaders": active_spreaders, "neighbour_probes": None, "rng_draws": rng_draws}
+    else:
+        seconds, counters, infected_num, non_infected_num = python_generation(simulation)
+    simulation.record_generation(infected_num, non_infected_num)
+    simulation.stats.record_generation(simulation, seconds, counters)
+
+
+def python_generation(simulation):
+    """
+    The passes of the reference engine in `Simulation.update`, timed one by one.
+
+    Returns:
+        tuple: The seconds and counters dicts, the number of newly infected persons and the number of
+        rejected spreading attempts.
+    """
+    offsets = simulation.neighbour_offsets
+    # the counting pass looks at the neighbours of the persons infected at the start of the generation and
+    # the spreading pass at the neighbours of every person infected when its turn comes, counted here as
+    # the persons infected at the end of the generation.
+    counting_probes = infected_neighbours(simulation.persons, offsets)
+    drawn = simulation.random_buffer.drawn()
+
+    start = time.perf_counter()
+    simulation.counting_pass()
+    counting_done = time.perf_counter()
+    infected_num, non_infected_num, active_spreaders = simulation.spreading_pass()
+    spreading_done = time.perf_counter()
+    simulation.reset_pass()
+    reset_done = time.perf_counter()
+
+    seconds = {"counting": counting_done - start, "spreading": spreading_done - counting_done,
+               "reset": reset_done - spreading_done}
+    counters = {"active_spreaders": active_spreaders,
+                "neighbour_probes": counting_probes + infected_neighbours(simulation.persons, offsets),
+                "rng_draws": simulation.random_buffer.drawn() - drawn}
+    return seconds, counters, infected_num, non_infected_num
+
+
+def infected_neighbours(persons, offsets):
+    """
+    Return the number of neighbours of the infected persons, from the CSR offsets of the neighbour index.
+    """
+    return sum(offsets[i + 1] - offsets[i] for i, person in enumerate(persons) if person.state != NON_INFECTED)
+
+
+def numpy_generation(engine):
+    """
+    `NumpyEngine.step` with its passes timed and counters, for the numpy engine and the graph engine built
+    on it.
+
+    Returns:
+        tuple: The seconds and counters dicts, the number of newly infected persons and the number of
+        rejected spreading attempts.
+    """
+    drawn = engine.random_buffer.drawn()
+    start = time.perf_counter()
+    engine.counting_pass()
+    counting_done = time.perf_counter()
+    infected_num, non_infected_num, active_spreaders = engine.spreading_pass()
+    spreading_done = time.perf_counter()
+    engine.reset_pass()
+    reset_done = time.perf_counter()
+
+    seconds = {"counting": counting_done - start, "spreading": spreading_done - counting_done,
+               "reset": reset_done - spreading_done}
+    # the counting pass looks at every neighbour of every person, the turns are counted like the ones of the
+    # reference engine.
+    offsets = engine.neighbour_offsets
+    counters = {"active_spreaders": active_spreaders,
+                "neighbour_probes": len(engine.neighbour_ids) + int(np.sum(offsets[1:][engine.infected] -
+                                                                           offsets[:-1][engine.infected])),
+                "rng_draws": engine.random_buffer.drawn() - drawn}
+    return seconds, counters, infected_num, non_infected_num
@@ -1,27 +1,10 @@
 # in order to create exe file pyinstaller main.py Simulator.py menu_screen.py --onefile --noconsole --hidden-import=pygame
-import sys
-import subprocess
-import pkg_resources
-import os
 import pygame
-import matplotlib.pyplot as plt
-import csv
-import random
-import time
-import yaml
-from Simulator import Simulation, WIDTH, HEIGHT, BLACK, WHITE
+import analysis
+from Simulator import Simulation, WIDTH, HEIGHT
 from menu_screen import run_menu_screen
 
 
-required = {'matplotlib', 'pygame'}
-installed = {pkg.key for pkg in pkg_resources.working_set}
-missing = required - installed
-if missing:
-    python = sys.executable
-    subprocess.check_call([python, '-m', 'pip', 'install', *missing], stdout=subprocess.DEVNULL)
-os.system('cls' if os.name == 'nt' else 'clear')
-
-
 def read_parameters():
     parameters = dict()
     try:
@@ -55,33 +38,28 @@ def read_parameters():
     return parameters
 
 
-def plot_info(simulation_name, info, number_of_persons):
+def plot_info(simulation_name, info, number_of_persons, path):
     """
-    Generates a plot of the percentage of the infected population over time and saves it as a pdf file if the user requests.
+    Generates a plot of the percentage of the infected population over time and saves it to an image file.
 
     Args:
         simulation_name (str): The name of the simulation.
         info (list): A list of integers representing the number of infected people in each generation of the simulation.
         number_of_persons (int): The number of persons in the simulation.
+        path (str): The image file to write, the format follows its extension.
 
     Returns:
         None
     """
-    prefix_sum = [sum(info[:i+1]) for i in range(len(info))]
-    percent_know = [num / number_of_persons * 100 for num in prefix_sum]
-
-    plt.plot(percent_know, color='r')
-    plt.xlabel("generation")
-    plt.ylabel("Infected population")
-    plt.title(simulation_name)
-    plt.show(block=True)
+    percent_know = analysis.percent_infected(info, number_of_persons)
+    analysis.plot_curves({"": [percent_know]}, path, title=simulation_name or "")
 
 
 def main():
     """Runs the main simulation.
 
     Reads the simulation parameters from a CSV file, initializes a Simulation object and runs the simulation using
-    Pygame. Once the simulation is completed, the results are plotted using Matplotlib.
+    Pygame. Once the simulation is completed, the results are plotted using Matplotlib to simulation_<n>.png.
 
     Returns:
         None
@@ -108,7 +86,7 @@ def main():
             return
 
         # Plot the simulation results using Matplotlib
-        plot_info(simulations_parameters.get("name"), info, s.num_persons)
+        plot_info(simulations_parameters.get("name"), info, s.num_persons, "simulation_%d.png" % (i + 1))
 
     # Quit Pygame
     pygame.quit()
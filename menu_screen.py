@@ -1,6 +1,5 @@
 import time
 import pygame
-pygame.init()
 HEIGHT = 800
 WIDTH = 600
 WHITE = (255, 255, 255)
@@ -121,6 +120,7 @@ def validate_inputs(inputs):
 
 
 def run_menu_screen():
+    pygame.init()
     input_boxes = []
     x = 300
     y = 260
@@ -0,0 +1,210 @@
+"""
+Streaming per generation metrics.
+
+A sink attached to a simulation (`Simulation.metrics_sink`) receives one record per generation and writes
+the records to disk in batches, so long runs do not have to keep their history in memory and the output
+can be read while the run is still going. Records hold the fields listed in `METRICS_FIELDS`.
+"""
+import abc
+import csv
+import json
+import os
+import weakref
+import numpy as np
+from Simulator import INFECTED_STATE, LEVELS
+
+METRICS_FIELDS = ["generation", "new_infections", "cumulative_infected", "rejection_rate"] + \
+                 ["infected_s%d" % level for level in LEVELS] + \
+                 ["persons_s%d" % level for level in LEVELS] + \
+                 ["non_infected", "infected"]
+
+
+def level_counts(simulation):
+    """
+    Count the persons and the infected persons of every original skepticism level of the simulation.
+
+    Returns:
+        tuple: The two counts, indexed by the skepticism level.
+    """
+    _, types, states, _ = simulation.population()
+    persons = np.bincount(types, minlength=len(LEVELS) + 1)
+    infected = np.bincount(types[states == INFECTED_STATE], minlength=len(LEVELS) + 1)
+    return persons, infected
+
+
+def metrics_record(simulation, infected_num, non_infected_num, persons, infected):
+    """
+    Build the metrics record of the generation the simulation just finished.
+
+    Args:
+        simulation (Simulation): The simulation, after `record_generation` counted the generation.
+        infected_num (int): The number of persons infected in this generation.
+        non_infected_num (int): The number of spreading attempts that were rejected.
+        persons (numpy.ndarray): The persons of every skepticism level.
+        infected (numpy.ndarray): The infected persons of every skepticism level, after this generation.
+
+    Returns:
+        dict: The record, with the keys of `METRICS_FIELDS`.
+    """
+    attempts = infected_num + non_infected_num
+    record = {
+        "generation": simulation.generation,
+        "new_infections": int(infected_num),
+        "cumulative_infected": simulation.infected_persons,
+        "rejection_rate": non_infected_num / attempts if attempts > 0 else 0.0,
+    }
+    for level in LEVELS:
+        record["infected_s%d" % level] = int(infected[level])
+    for level in LEVELS:
+        record["persons_s%d" % level] = int(persons[level])
+    record["infected"] = int(infected.sum())
+    record["non_infected"] = int(persons.sum()) - record["infected"]
+    return record
+
+
+class MetricsSink(abc.ABC):
+    """
+    Base class of the sinks: collects records and hands them to `write_batch` in batches. A sink subclass
+    implements `write_batch` and, when it holds an open file, extends `close` to close it.
+
+    Args:
+        path (str): The output file.
+        batch_size (int): The number of records kept in memory before they are written.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch = []
+        # weak reference to the simulation the per level counts belong to, counted from its population once.
+        self.simulation = None
+        self.persons = None
+        self.infected = None
+
+    def record(self, simulation, infected_num, non_infected_num):
+        """
+        Add the record of the generation the simulation just finished.
+        """
+        if self.simulation is None or self.simulation() is not simulation:
+            # the population already includes this generation, so nothing is added to the first counts.
+            self.simulation = weakref.ref(simulation)
+            self.persons, self.infected = level_counts(simulation)
+        else:
+            self.infected += simulation.newly_infected_levels()
+        self.write(metrics_record(simulation, infected_num, non_infected_num, self.persons, self.infected))
+
+    def write(self, record):
+        """
+        Add a record, writing the batch to disk when it is full.
+        """
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending records to disk.
+        """
+        if self.batch:
+            self.write_batch(self.batch)
+            self.batch = []
+
+    @abc.abstractmethod
+    def write_batch(self, records):
+        """
+        Write a batch of records to the output file.
+
+        Args:
+            records (list): The records, dicts with the keys of `METRICS_FIELDS`.
+        """
+
+    def close(self):
+        """
+        Write the pending records and close the output file.
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CSVSink(MetricsSink):
+    def __init__(self, path, batch_size=1000):
+        super().__init__(path, batch_size)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=METRICS_FIELDS)
+        self.writer.writeheader()
+
+    def write_batch(self, records):
+        self.writer.writerows(records)
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class NDJSONSink(MetricsSink):
+    def __init__(self, path, batch_size=1000):
+        super().__init__(path, batch_size)
+        self.file = open(path, 'w')
+
+    def write_batch(self, records):
+        self.file.write("".join(json.dumps(record) + "\n" for record in records))
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class ParquetSink(MetricsSink):
+    """
+    Writes every batch as a row group of a parquet file, needs the optional pyarrow package.
+
+    Unlike csv and ndjson the file can only be read once the sink is closed.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(path, batch_size)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("writing parquet metrics needs pyarrow: pip install pyarrow")
+        self.pyarrow = pyarrow
+        self.writer = None
+
+    def write_batch(self, records):
+        table = self.pyarrow.Table.from_pylist(records)
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+SINKS = {".csv": CSVSink, ".ndjson": NDJSONSink, ".jsonl": NDJSONSink, ".parquet": ParquetSink}
+
+
+def open_sink(path, batch_size=1000):
+    """
+    Open the sink matching the extension of `path` (.csv, .ndjson, .jsonl or .parquet).
+
+    Args:
+        path (str): The output file.
+        batch_size (int): The number of records kept in memory before they are written.
+
+    Returns:
+        MetricsSink: The opened sink.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError("unknown metrics format %r, expected one of %s" % (extension, sorted(SINKS)))
+    return SINKS[extension](path, batch_size)
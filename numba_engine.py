@@ -0,0 +1,176 @@
+"""
+Compiled engine for `Simulation.update`, needs the optional numba package (pip install numba).
+
+A generation is one pass over the persons in `Simulation.persons` order, compiled by numba, over the CSR
+neighbour index of `build_neighbour_index`. Like the frontier engine, the rumors counter of a person is only
+computed when it gets its turn to spread, from the neighbours that were infected at the start of the
+generation, so there is no counting or reset pass. The random numbers are taken from
+`Simulation.random_buffer` in the same order as the reference engine, so the results are identical to the
+`python` engine for the same seed.
+"""
+import numpy as np
+from Simulator import EMPTY_STATE, NON_INFECTED_STATE, INFECTED_STATE, MOVE_SET, LEVELS, RANDOM_BUFFER_SIZE, \
+    build_neighbour_index
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+NUMBA_AVAILABLE = njit is not None
+
+
+def generation_kernel(start, infected, skepticism, cooldowns, offsets, neighbour_ids, infected_mark, mark,
+                      l_generation, draws, counts):
+    """
+    Run the turns of the persons from index `start` on, until the end or until `draws` may run out.
+
+    Args:
+        start (int): The index of the first person to visit.
+        infected (numpy.ndarray): Whether every person is infected, updated in place.
+        skepticism (numpy.ndarray): The original skepticism level of every person.
+        cooldowns (numpy.ndarray): The stop_spreading_duration of every person, updated in place.
+        offsets (numpy.ndarray): The `neighbour_offsets` of the CSR index.
+        neighbour_ids (numpy.ndarray): The `neighbour_ids` of the CSR index.
+        infected_mark (numpy.ndarray): `mark` for the persons infected in this generation, updated in place.
+        mark (int): The mark of this generation.
+        l_generation (int): The cooldown after passing the rumor on.
+        draws (numpy.ndarray): Uniform random numbers in [0, 1).
+        counts (numpy.ndarray): The newly infected persons, the rejected attempts and then the newly infected
+            persons of every skepticism level, added to in place.
+
+    Returns:
+        tuple: The index of the first person that was not visited (the number of persons when all were)
+        and the number of random numbers used.
+    """
+    used = 0
+    for i in range(start, len(infected)):
+        if not infected[i]:
+            continue
+        if cooldowns[i] == 0:
+            # the rumors counter only counts the persons that were infected at the start of the generation.
+            counter = 0
+            for k in range(offsets[i], offsets[i + 1]):
+                j = neighbour_ids[k]
+                if infected[j] and infected_mark[j] != mark:
+                    counter += 1
+            level = skepticism[i]
+            if counter >= 2 and level > 1:
+                level -= 1
+            if (level == 2 or level == 3) and len(draws) - used < offsets[i + 1] - offsets[i]:
+                return i, used
+            if level != 4:
+                for k in range(offsets[i], offsets[i + 1]):
+                    if cooldowns[i] != 0:
+                        break
+                    if level == 2:
+                        random_number = draws[used]
+                        used += 1
+                        if random_number >= 2 / 3:
+                            counts[1] += 1
+                            continue
+                    elif level == 3:
+                        random_number = draws[used]
+                        used += 1
+                        if random_number >= 1 / 3:
+                            counts[1] += 1
+                            continue
+                    cooldowns[i] = l_generation
+                    j = neighbour_ids[k]
+                    if not infected[j]:
+                        infected[j] = True
+                        infected_mark[j] = mark
+                        counts[0] += 1
+                        counts[2 + skepticism[j]] += 1
+        if cooldowns[i] > 0:
+            cooldowns[i] -= 1
+    return len(infected), used
+
+
+if NUMBA_AVAILABLE:
+    generation_kernel = njit(cache=True)(generation_kernel)
+
+
+class NumbaEngine:
+    """
+    Engine for `Simulation.update` running `generation_kernel` on arrays of the persons.
+
+    No `Person` objects are created, the population is kept as arrays in `Simulation.persons` order.
+    """
+
+    def __init__(self, simulation, cells, types, states, cooldowns=None):
+        """
+        Build the arrays and the neighbour index of the population placed by `Simulation.init_simulation`.
+
+        Args:
+            simulation (Simulation): The simulation this engine advances.
+            cells (numpy.ndarray): The flat (row-major) cell index of every person.
+            types (numpy.ndarray): The original skepticism level of every person.
+            states (numpy.ndarray): The NON_INFECTED_STATE or INFECTED_STATE code of every person.
+            cooldowns (numpy.ndarray): The stop_spreading_duration of every person, all 0 by default.
+        """
+        self.rows = simulation.rows
+        self.cols = simulation.cols
+        self.l_generation = simulation.l_generation
+        self.random_buffer = simulation.random_buffer
+        self.cells = np.array(cells, dtype=np.int64)
+        self.skepticism = np.array(types, dtype=np.int8)
+        self.infected = np.asarray(states) == INFECTED_STATE
+        if cooldowns is None:
+            self.stop_spreading_duration = np.zeros(len(self.cells), dtype=np.int32)
+        else:
+            self.stop_spreading_duration = np.array(cooldowns, dtype=np.int32)
+        offsets, neighbour_ids = build_neighbour_index(self.cells, self.rows, self.cols)
+        self.neighbour_offsets = np.frombuffer(offsets, dtype=np.int64)
+        self.neighbour_ids = np.frombuffer(neighbour_ids, dtype=np.int64)
+        self.infected_mark = np.zeros(len(self.cells), dtype=np.int64)
+        self.mark = 0
+        # the persons infected in the last generation by skepticism level, counted by the kernel.
+        self.levels = np.zeros(len(LEVELS) + 1, dtype=np.int64)
+        # random numbers handed to the kernel at once, twice what the last generation used.
+        self.draws_per_call = RANDOM_BUFFER_SIZE
+
+    def step(self):
+        """
+        Advance the population by one generation.
+
+        Returns:
+            tuple: The number of newly infected persons and the number of rejected spreading attempts.
+        """
+        self.mark += 1
+        counts = np.zeros(3 + len(LEVELS), dtype=np.int64)
+        start = 0
+        total_used = 0
+        while start < len(self.cells):
+            draws = self.random_buffer.take(max(self.draws_per_call, len(MOVE_SET)))
+            start, used = generation_kernel(start, self.infected, self.skepticism, self.stop_spreading_duration,
+                                            self.neighbour_offsets, self.neighbour_ids, self.infected_mark,
+                                            self.mark, self.l_generation, draws, counts)
+            # the numbers the kernel did not use are the next ones of the stream.
+            self.random_buffer.give_back(draws[used:])
+            total_used += used
+        # the next generation most likely needs about as many, so it runs in one call with the fewest numbers.
+        self.draws_per_call = max(RANDOM_BUFFER_SIZE, 2 * total_used)
+        self.levels = counts[2:]
+        return int(counts[0]), int(counts[1])
+
+    def newly_infected_levels(self):
+        """
+        Return how many persons of every original skepticism level got infected in the last generation.
+        """
+        return self.levels
+
+    def population(self):
+        """
+        Return the population as arrays, in the format taken by `Simulation.populate`.
+
+        Returns:
+            tuple: The cells, original skepticism levels, state codes and cooldowns of every person.
+        """
+        states = self.infected.astype(np.int8) + NON_INFECTED_STATE
+        return self.cells, self.skepticism, states, self.stop_spreading_duration
+
+    def state_grid(self):
+        state = np.full(self.rows * self.cols, EMPTY_STATE, dtype=np.int8)
+        state[self.cells] = self.infected.astype(np.int8) + NON_INFECTED_STATE
+        return state.reshape(self.rows, self.cols)
@@ -0,0 +1,482 @@
+"""
+Array based engine for `Simulation.update`.
+
+The population is kept as arrays in `Simulation.persons` order and a generation gives exactly the results of
+the reference engine for the same seed: the persons take their turns in order, a person infected earlier in
+the generation spreads in the same generation, and the random numbers come from `Simulation.random_buffer`
+in the same order.
+
+A turn depends on the turns before it, through the persons they infected and the random numbers they used,
+so `cascade_generation` runs the turns as repeated passes over windows of persons. A pass computes every
+turn of the window from the persons infected when it starts and keeps the turns up to the first person that
+a turn of the window infects before its own turn: that person spreads in this generation, so the next pass
+starts at it. Generations where the rumor travels little between turns take few passes.
+
+The synchronous kernels (`count_rumors` to `cool_down`) compute a generation from the state at its start
+instead, so a person infected in a generation only spreads from the next one. The tiled engine runs that
+model, see `SYNCHRONOUS_ENGINES`.
+"""
+import numpy as np
+from Simulator import MOVE_SET, LEVELS, EMPTY_STATE, NON_INFECTED_STATE, INFECTED_STATE, RANDOM_BUFFER_SIZE, \
+    build_neighbour_index
+
+# probability that a spreader of the given skepticism level passes the rumor on, indexed by level.
+SPREAD_PROBABILITY = np.array([0, 1, 2 / 3, 1 / 3, 0], dtype=np.float64)
+# smallest number of persons of a lane that one pass of `cascade_generation` looks at.
+MIN_WINDOW = 256
+
+
+def count_rumors(state):
+    """
+    Count for every cell how many infected neighbours it has on the toroidal grid.
+
+    Args:
+        state (numpy.ndarray): The state codes, the last two axes are the grid rows and columns.
+
+    Returns:
+        numpy.ndarray: The number of infected neighbours of each occupied cell, 0 for empty cells.
+    """
+    spreaders = (state == INFECTED_STATE).view(np.uint8)
+    counter = np.zeros(state.shape, dtype=np.uint8)
+    for row, col in MOVE_SET:
+        # the person at (r, c) hears the rumor from the spreader at (r - row, c - col).
+        counter += np.roll(spreaders, (row, col), axis=(-2, -1))
+    counter[state == EMPTY_STATE] = 0
+    return counter
+
+
+def effective_skepticism(original_skepticism, rumors_counter):
+    """
+    Lower the skepticism level by one (but not under 1) for every person that heard the rumor twice.
+
+    Args:
+        original_skepticism (numpy.ndarray): The skepticism levels the persons were created with.
+        rumors_counter (numpy.ndarray): The number of infected neighbours of each person.
+
+    Returns:
+        numpy.ndarray: The skepticism level used during this generation.
+    """
+    lowered = np.maximum(original_skepticism - 1, 1).astype(original_skepticism.dtype)
+    return np.where(rumors_counter >= 2, lowered, original_skepticism)
+
+
+def spread_attempts(state, skepticism, l_generation, spreaders, draws):
+    """
+    Let every active spreader try its neighbours in `MOVE_SET` order until the first success.
+
+    This follows the rules of `Simulation.update`: a level 1 spreader always passes the rumor, level 2
+    and 3 spreaders pass it with probability 2/3 and 1/3 and every failure counts as a rejection,
+    level 4 spreaders never pass it. A successful attempt starts the `l_generation` cooldown, so with
+    a positive `l_generation` the remaining neighbours are skipped.
+
+    Args:
+        state (numpy.ndarray): The state codes.
+        skepticism (numpy.ndarray): The skepticism level of each person for this generation.
+        l_generation (int): The cooldown a spreader gets after passing the rumor.
+        spreaders (tuple): The coordinates of the infected persons that are not cooling down.
+        draws (numpy.ndarray): Uniform numbers in [0, 1) of shape (len(MOVE_SET), number of spreaders).
+
+    Returns:
+        tuple: A mask of the cells the rumor was passed to, a mask of the spreaders that passed it and the
+        number of rejected attempts of every spreader.
+    """
+    shape = state.shape
+    rows, cols = shape[-2], shape[-1]
+    leading = spreaders[:-2]
+    spreader_rows, spreader_cols = spreaders[-2], spreaders[-1]
+    levels = skepticism[spreaders]
+    probability = SPREAD_PROBABILITY[levels]
+    counts_rejection = (levels == 2) | (levels == 3)
+    pending = np.ones(len(spreader_rows), dtype=bool)
+    succeeded = np.zeros(len(spreader_rows), dtype=bool)
+    received = np.zeros(shape, dtype=bool)
+    rejections = np.zeros(len(spreader_rows), dtype=np.int64)
+    for k, (row, col) in enumerate(MOVE_SET):
+        target = leading + ((spreader_rows + row) % rows, (spreader_cols + col) % cols)
+        attempt = pending & (state[target] != EMPTY_STATE)
+        success = attempt & (draws[k] < probability)
+        rejections += attempt & ~success & counts_rejection
+        received[tuple(axis[success] for axis in target)] = True
+        succeeded |= success
+        if l_generation > 0:
+            pending &= ~success
+    return received, succeeded, rejections
+
+
+def cool_down(stop_spreading_duration, infected):
+    """
+    Decrement the cooldown of every person that was infected at the start of the generation.
+    """
+    cooling = infected & (stop_spreading_duration > 0)
+    stop_spreading_duration[cooling] -= 1
+
+
+def count_heard(infected, offsets, neighbour_ids):
+    """
+    Count the infected neighbours of every person from the CSR neighbour index.
+
+    Args:
+        infected (numpy.ndarray): Whether every person is infected.
+        offsets (numpy.ndarray): The `neighbour_offsets` of the CSR index.
+        neighbour_ids (numpy.ndarray): The `neighbour_ids` of the CSR index.
+
+    Returns:
+        numpy.ndarray: The number of infected neighbours of every person.
+    """
+    # the neighbours of a person are the persons it is a neighbour of, so it hears the rumor from each of its
+    # infected neighbours.
+    spreaders = np.flatnonzero(infected)
+    if 2 * len(spreaders) < len(infected):
+        # few persons are infected, only their neighbours are looked at.
+        degree = offsets[spreaders + 1] - offsets[spreaders]
+        edges = np.repeat(offsets[spreaders] - (np.cumsum(degree) - degree), degree) + np.arange(degree.sum())
+        return np.bincount(neighbour_ids[edges], minlength=len(infected))
+    heard = np.zeros(len(neighbour_ids) + 1, dtype=np.int64)
+    np.cumsum(infected[neighbour_ids], out=heard[1:])
+    return heard[offsets[1:]] - heard[offsets[:-1]]
+
+
+def lane_positions(amounts, item_lanes, position):
+    """
+    Return where every item starts when the items of a lane take `amounts` numbers one after the other.
+
+    Args:
+        amounts (numpy.ndarray): The numbers every item takes, the items sorted by lane.
+        item_lanes (numpy.ndarray): The lane of every item.
+        position (numpy.ndarray): The position the first item of every lane starts at.
+
+    Returns:
+        numpy.ndarray: The position of the first number of every item.
+    """
+    before = np.cumsum(amounts) - amounts
+    first = np.ones(len(amounts), dtype=bool)
+    first[1:] = item_lanes[1:] != item_lanes[:-1]
+    # `before` does not decrease, so this carries the value at the first item of every lane to the others.
+    lane_start = np.maximum.accumulate(np.where(first, before, 0))
+    return position[item_lanes] + before - lane_start
+
+
+def widen(rows, width, fill):
+    """
+    Return a copy of the 2D array `rows` with `fill` columns added up to `width` columns.
+    """
+    widened = np.full((len(rows), width), fill, dtype=rows.dtype)
+    widened[:, :rows.shape[1]] = rows
+    return widened
+
+
+class DrawStreams:
+    """
+    The random numbers of one generation of `cascade_generation`, one stream per lane.
+
+    Every lane takes numbers from its own `RandomBuffer` as far as the passes need them, and the ones its
+    turns did not use are given back at the end of the generation, so each lane uses exactly the numbers the
+    reference engine uses.
+
+    Args:
+        buffers (list): The `RandomBuffer` of every lane.
+        first_success (bool): Whether to index the first number a level 2 or 3 spreader passes the rumor
+            with, from every position, see `next_success`.
+    """
+
+    def __init__(self, buffers, first_success):
+        self.buffers = buffers
+        self.first_success = first_success
+        self.values = np.empty((len(buffers), 0))
+        # the numbers taken by every lane, the rest of its row is 1 so nobody passes the rumor with them.
+        self.length = np.zeros(len(buffers), dtype=np.int64)
+        # for levels 2 and 3, the position of the first number from each position on that is under the
+        # probability of the level, or one past the numbers of the lane when there is none.
+        self.next_success = {level: np.empty((len(buffers), 0), dtype=np.int64) for level in (2, 3)}
+
+    def ensure(self, needed):
+        """
+        Take numbers for the lanes that hold less than `needed` of them.
+        """
+        short = np.flatnonzero(needed > self.length)
+        if len(short) == 0:
+            return
+        capacity = self.values.shape[1]
+        if needed.max() > capacity:
+            capacity = max(int(needed.max()), 2 * capacity, RANDOM_BUFFER_SIZE)
+            self.values = widen(self.values, capacity, 1)
+            if self.first_success:
+                for level in (2, 3):
+                    self.next_success[level] = widen(self.next_success[level], capacity, capacity)
+        for lane in short.tolist():
+            length = int(self.length[lane])
+            amount = min(capacity, max(int(needed[lane]), 2 * length, RANDOM_BUFFER_SIZE)) - length
+            self.values[lane, length:length + amount] = self.buffers[lane].take(amount)
+            self.length[lane] = length + amount
+        if self.first_success:
+            positions = np.arange(capacity)
+            for level in (2, 3):
+                success = np.where(self.values[short] < SPREAD_PROBABILITY[level], positions, capacity)
+                self.next_success[level][short] = np.minimum.accumulate(success[:, ::-1], axis=1)[:, ::-1]
+
+    def give_back(self, used):
+        """
+        Give the numbers after the first `used` of every lane back to its buffer.
+        """
+        for lane, buffer in enumerate(self.buffers):
+            buffer.give_back(self.values[lane, used[lane]:self.length[lane]])
+
+
+def all_attempts(spreaders, spreader_lanes, level, offsets, neighbour_ids, position, streams):
+    """
+    The turns of spreaders that try all their neighbours, without a cooldown (`l_generation` 0).
+
+    Returns:
+        tuple: The persons that passed the rumor and the persons they passed it to, the number of rejected
+        attempts and of random numbers used by every spreader.
+    """
+    degree = offsets[spreaders + 1] - offsets[spreaders]
+    used = np.where(level == 1, 0, degree)
+    start = lane_positions(used, spreader_lanes, position)
+    streams.ensure(position + np.bincount(spreader_lanes, weights=used, minlength=len(position)).astype(np.int64))
+    owner = np.repeat(np.arange(len(spreaders)), degree)
+    slot = np.arange(len(owner)) - np.repeat(np.cumsum(degree) - degree, degree)
+    passed = np.ones(len(owner), dtype=bool)
+    drawing = np.flatnonzero(level[owner] != 1)
+    drawer = owner[drawing]
+    passed[drawing] = streams.values[spreader_lanes[drawer], start[drawer] + slot[drawing]] < \
+        SPREAD_PROBABILITY[level[drawer]]
+    rejections = np.bincount(owner[~passed], minlength=len(spreaders))
+    return (spreaders[owner[passed]], neighbour_ids[offsets[spreaders][owner[passed]] + slot[passed]], rejections,
+            used)
+
+
+def first_attempts(spreaders, spreader_lanes, level, offsets, neighbour_ids, position, streams):
+    """
+    The turns of spreaders that stop at their first success, with a cooldown (`l_generation` over 0).
+
+    Returns:
+        tuple: The persons that passed the rumor and the persons they passed it to, the number of rejected
+        attempts and of random numbers used by every spreader, and whether it passed the rumor.
+    """
+    degree = offsets[spreaders + 1] - offsets[spreaders]
+    slot = np.zeros(len(spreaders), dtype=np.int64)
+    passed = np.ones(len(spreaders), dtype=bool)
+    used = np.zeros(len(spreaders), dtype=np.int64)
+    drawing = np.flatnonzero(level != 1)
+    if len(drawing):
+        lanes, levels, degrees = spreader_lanes[drawing], level[drawing], degree[drawing]
+        streams.ensure(position + np.bincount(lanes, weights=degrees, minlength=len(position)).astype(np.int64))
+        first = np.ones(len(drawing), dtype=bool)
+        first[1:] = lanes[1:] != lanes[:-1]
+        # a spreader starts after the last number of the one before it, which depends on where that one
+        # started. Starting from every attempt failing, the starts only move back and are right for one more
+        # spreader on every round, until none moves.
+        start = lane_positions(degrees, lanes, position)
+        while True:
+            success = np.where(levels == 2, streams.next_success[2][lanes, start],
+                               streams.next_success[3][lanes, start])
+            end = np.minimum(success, start + degrees - 1)
+            following = np.empty_like(start)
+            following[1:] = end[:-1] + 1
+            following[first] = position[lanes[first]]
+            if np.array_equal(following, start):
+                break
+            start = following
+        passed[drawing] = success <= end
+        slot[drawing] = np.where(passed[drawing], success - start, degrees)
+        used[drawing] = end - start + 1
+    # a level 1 spreader passes the rumor to its first neighbour, the others failed `slot` times first.
+    return spreaders[passed], neighbour_ids[offsets[spreaders[passed]] + slot[passed]], slot, used, passed
+
+
+def cascade_generation(infected, skepticism, cooldowns, offsets, neighbour_ids, lanes, l_generation, streams):
+    """
+    Give every infected person its turn of one generation of the reference model, for `lanes` populations.
+
+    The arrays hold the persons of one lane after the other, in `Simulation.persons` order within a lane, and
+    the neighbour index uses these flat indexes: the lanes are independent populations of the same size.
+
+    Args:
+        infected (numpy.ndarray): Whether every person is infected, updated in place.
+        skepticism (numpy.ndarray): The skepticism level of every person for this generation, after the
+            counting pass.
+        cooldowns (numpy.ndarray): The stop_spreading_duration of every person, updated in place.
+        offsets (numpy.ndarray): The `neighbour_offsets` of the CSR index.
+        neighbour_ids (numpy.ndarray): The `neighbour_ids` of the CSR index.
+        lanes (int): The number of populations.
+        l_generation (int): The cooldown after passing the rumor on.
+        streams (DrawStreams): The random numbers of every lane, the unused ones are given back.
+
+    Returns:
+        tuple: The mask of the newly infected persons, and per lane the number of newly infected persons,
+        of rejected spreading attempts and of infected persons that were not cooling down when their turn
+        came.
+    """
+    persons = len(infected) // lanes
+    lane_base = np.arange(lanes) * persons
+    # the persons whose turn can pass the rumor on or use random numbers, when they are not cooling down.
+    spreading = (skepticism != 4) & (offsets[1:] > offsets[:-1])
+    newly_infected = np.zeros(len(infected), dtype=bool)
+    infected_num = np.zeros(lanes, dtype=np.int64)
+    rejected = np.zeros(lanes, dtype=np.int64)
+    active = np.zeros(lanes, dtype=np.int64)
+    # per lane, the first person whose turn did not run yet and the position of its next random number.
+    turn = np.zeros(lanes, dtype=np.int64)
+    position = np.zeros(lanes, dtype=np.int64)
+    window = min(MIN_WINDOW, persons)
+    running = np.arange(lanes) if persons else np.empty(0, dtype=np.int64)
+    while len(running):
+        end = turn.copy()
+        end[running] = np.minimum(turn[running] + window, persons)
+        sizes = end[running] - turn[running]
+        window_start = np.repeat(lane_base[running] + turn[running] - (np.cumsum(sizes) - sizes), sizes)
+        window_persons = np.arange(sizes.sum()) + window_start
+        visited = window_persons[infected[window_persons]]
+        idle = visited[cooldowns[visited] == 0]
+        spreaders = idle[spreading[idle]]
+        spreader_lanes = spreaders // persons
+        level = skepticism[spreaders]
+        if l_generation > 0:
+            infectors, targets, rejections, used, passed = first_attempts(spreaders, spreader_lanes, level, offsets,
+                                                                          neighbour_ids, position, streams)
+        else:
+            infectors, targets, rejections, used = all_attempts(spreaders, spreader_lanes, level, offsets,
+                                                                neighbour_ids, position, streams)
+
+        # a person infected by an earlier turn of the window spreads when its own turn comes: the turns after
+        # it depend on its turn, so the next pass starts from it.
+        target_lanes = targets // persons
+        late = (targets > infectors) & ~infected[targets] & (targets < lane_base[target_lanes] + end[target_lanes])
+        stop = end.copy()
+        spreading_late = late & spreading[targets]
+        late_lanes = target_lanes[spreading_late]
+        np.minimum.at(stop, late_lanes, targets[spreading_late] - lane_base[late_lanes])
+        limit = lane_base + stop
+
+        kept = spreaders < limit[spreader_lanes]
+        reached = infectors < limit[target_lanes]
+        fresh = np.unique(targets[reached & ~infected[targets]])
+        # the late persons before the stop do not spread, but they get their turn.
+        late_turns = np.unique(targets[reached & late & (targets < limit[target_lanes])])
+        kept_idle = idle[idle < limit[idle // persons]]
+        active += np.bincount(kept_idle // persons, minlength=lanes)
+        active += np.bincount(late_turns // persons, minlength=lanes)
+        infected[fresh] = True
+        newly_infected[fresh] = True
+        infected_num += np.bincount(fresh // persons, minlength=lanes)
+        rejected += np.bincount(spreader_lanes[kept], weights=rejections[kept], minlength=lanes).astype(np.int64)
+        position += np.bincount(spreader_lanes[kept], weights=used[kept], minlength=lanes).astype(np.int64)
+        if l_generation > 0:
+            cooldowns[spreaders[kept & passed]] = l_generation
+        kept_visited = visited[visited < limit[visited // persons]]
+        cooling = kept_visited[cooldowns[kept_visited] > 0]
+        cooldowns[cooling] -= 1
+
+        finished = stop[running] == end[running]
+        window = min(2 * window, persons) if finished.all() else max(MIN_WINDOW, window // 2)
+        turn[running] = stop[running]
+        running = running[turn[running] < persons]
+    streams.give_back(position)
+    return newly_infected, infected_num, rejected, active
+
+
+class NumpyEngine:
+    """
+    Array based engine for `Simulation.update`.
+
+    No `Person` objects are created: the population is kept as arrays in `Simulation.persons` order with the
+    CSR neighbour index of `build_neighbour_index`, and a generation is a counting pass over the index, the
+    turns of `cascade_generation` and a reset pass.
+    """
+
+    def __init__(self, simulation, cells, types, states, cooldowns=None):
+        """
+        Build the arrays and the neighbour index of the population placed by `Simulation.init_simulation`.
+
+        Args:
+            simulation (Simulation): The simulation this engine advances.
+            cells (numpy.ndarray): The flat (row-major) cell index of every person.
+            types (numpy.ndarray): The original skepticism level of every person.
+            states (numpy.ndarray): The NON_INFECTED_STATE or INFECTED_STATE code of every person.
+            cooldowns (numpy.ndarray): The stop_spreading_duration of every person, all 0 by default.
+        """
+        self.rows = simulation.rows
+        self.cols = simulation.cols
+        self.l_generation = simulation.l_generation
+        self.random_buffer = simulation.random_buffer
+        self.cells = np.array(cells, dtype=np.int64)
+        self.original_skepticism = np.array(types, dtype=np.int8)
+        self.skepticism = self.original_skepticism
+        self.infected = np.asarray(states) == INFECTED_STATE
+        if cooldowns is None:
+            self.stop_spreading_duration = np.zeros(len(self.cells), dtype=np.int32)
+        else:
+            self.stop_spreading_duration = np.array(cooldowns, dtype=np.int32)
+        self.neighbour_offsets, self.neighbour_ids = self.neighbour_index(simulation)
+        self.rumors_counter = np.zeros(len(self.cells), dtype=np.int64)
+        # the mask of the persons infected in the last generation.
+        self.newly_infected = np.zeros(len(self.cells), dtype=bool)
+
+    def neighbour_index(self, simulation):
+        """
+        Return the `neighbour_offsets` and `neighbour_ids` arrays of the CSR index of the persons.
+        """
+        offsets, neighbour_ids = build_neighbour_index(self.cells, self.rows, self.cols)
+        return np.frombuffer(offsets, dtype=np.int64), np.frombuffer(neighbour_ids, dtype=np.int64)
+
+    def step(self):
+        """
+        Advance the population by one generation.
+
+        Returns:
+            tuple: The number of newly infected persons and the number of rejected spreading attempts.
+        """
+        self.counting_pass()
+        infected_num, non_infected_num, _ = self.spreading_pass()
+        self.reset_pass()
+        return infected_num, non_infected_num
+
+    def counting_pass(self):
+        """
+        Count the infected neighbours of every person and lower the skepticism of the persons that heard twice.
+        """
+        self.rumors_counter = count_heard(self.infected, self.neighbour_offsets, self.neighbour_ids)
+        self.skepticism = effective_skepticism(self.original_skepticism, self.rumors_counter)
+
+    def spreading_pass(self):
+        """
+        Give every infected person its turn to pass the rumor on, in `Simulation.persons` order.
+
+        Returns:
+            tuple: The number of newly infected persons, the number of rejected spreading attempts and the
+            number of infected persons that were not cooling down when their turn came.
+        """
+        streams = DrawStreams([self.random_buffer], self.l_generation > 0)
+        self.newly_infected, infected_num, rejected, active = cascade_generation(
+            self.infected, self.skepticism, self.stop_spreading_duration, self.neighbour_offsets,
+            self.neighbour_ids, 1, self.l_generation, streams)
+        return int(infected_num[0]), int(rejected[0]), int(active[0])
+
+    def reset_pass(self):
+        """
+        Restart the rumors counters and skepticism levels after the generation.
+        """
+        self.skepticism = self.original_skepticism
+        self.rumors_counter[:] = 0
+
+    def newly_infected_levels(self):
+        """
+        Return how many persons of every original skepticism level got infected in the last generation.
+        """
+        return np.bincount(self.original_skepticism[self.newly_infected], minlength=len(LEVELS) + 1)
+
+    def state_grid(self):
+        state = np.full(self.rows * self.cols, EMPTY_STATE, dtype=np.int8)
+        state[self.cells] = self.infected.astype(np.int8) + NON_INFECTED_STATE
+        return state.reshape(self.rows, self.cols)
+
+    def population(self):
+        """
+        Return the population as arrays, in the format taken by `Simulation.populate`.
+
+        Returns:
+            tuple: The cells, original skepticism levels, state codes and cooldowns of every person.
+        """
+        states = self.infected.astype(np.int8) + NON_INFECTED_STATE
+        return self.cells, self.original_skepticism, states, self.stop_spreading_duration
@@ -0,0 +1,143 @@
+"""
+Recording of the grid to an animation file without a window.
+
+A recorder attached to a simulation (`Simulation.recorder`) copies the state grid every `every` generations
+as a uint8 frame of state codes and puts it on a bounded queue. A background thread takes the frames off
+the queue and writes them, so the simulation never waits for the encoding: when the writer falls behind
+and the queue is full the frame is dropped and counted in `dropped`.
+
+The format follows the extension of the output file:
+
+    .gif            an animated GIF, needs Pillow (pip install Pillow)
+    .png, .apng     an animated PNG, needs Pillow
+    anything else   raw frames: rows * cols bytes of state codes per frame, read them with `read_raw_frames`
+
+Pillow writes an animation in one go, so the GIF and PNG writers keep the frames (one byte per cell) until
+the recorder is closed; the raw writer streams every frame to the file as it comes.
+
+Example:
+    simulation.recorder = FrameRecorder("run.gif", every=5)
+    ...
+    simulation.recorder.close()
+"""
+import os
+import queue
+import threading
+import numpy as np
+from Simulator import WHITE, Person
+
+# color of every state code in the frames: empty, non infected and infected.
+FRAME_PALETTE = [WHITE, Person.color_not_infected, Person.color_infected]
+ANIMATION_FORMATS = {".gif": "GIF", ".png": "PNG", ".apng": "PNG"}
+
+
+def read_raw_frames(path, rows, cols):
+    """
+    Read a raw frame file written by `FrameRecorder`.
+
+    Returns:
+        numpy.ndarray: The (frames, rows, cols) state codes, mapped from the file.
+    """
+    return np.memmap(path, dtype=np.uint8, mode='r').reshape(-1, rows, cols)
+
+
+class FrameRecorder:
+    """
+    Captures frames of a simulation and writes them from a background thread.
+
+    Args:
+        path (str): The output file, its extension selects the format.
+        every (int): Capture the generations that are a multiple of this.
+        queue_size (int): The number of frames waiting for the writer before new frames are dropped.
+        scale (int): The size in pixels of a cell in GIF and PNG frames.
+        fps (float): The frames per second of GIF and PNG animations.
+    """
+
+    def __init__(self, path, every=1, queue_size=64, scale=1, fps=10):
+        if every < 1:
+            raise ValueError("every must be at least 1, got %s" % every)
+        self.path = path
+        self.every = every
+        self.scale = scale
+        self.fps = fps
+        self.format = ANIMATION_FORMATS.get(os.path.splitext(path)[1].lower())
+        if self.format is not None:
+            try:
+                import PIL.Image  # noqa: F401
+            except ImportError:
+                raise ImportError("recording a %s file needs Pillow: pip install Pillow" % self.format)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.captured = 0
+        self.dropped = 0
+        # an exception of the writer thread, raised again by `close`.
+        self.error = None
+        self.writer = threading.Thread(target=self.write_frames, name="frame-writer", daemon=True)
+        self.writer.start()
+
+    def capture(self, simulation):
+        """
+        Queue the current state grid of the simulation, if its generation is recorded.
+        """
+        if simulation.generation % self.every != 0:
+            return
+        frame = simulation.state_grid().astype(np.uint8)
+        try:
+            self.frames.put_nowait(frame)
+            self.captured += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def queued_frames(self):
+        """
+        Yield the frames taken off the queue, until `close` queues None.
+        """
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            yield frame
+
+    def write_frames(self):
+        """
+        Body of the writer thread: write the frames until `close` queues None.
+        """
+        try:
+            if self.format is None:
+                with open(self.path, 'wb') as f:
+                    for frame in self.queued_frames():
+                        f.write(frame.tobytes())
+            else:
+                self.write_animation(self.queued_frames())
+        except Exception as error:
+            self.error = error
+            # keep emptying the queue so `close` does not wait on a dead writer.
+            for _ in self.queued_frames():
+                pass
+
+    def write_animation(self, frames):
+        """
+        Convert the frames to palette images and save them as one GIF or PNG animation.
+        """
+        from PIL import Image
+        palette = [channel for color in FRAME_PALETTE for channel in color]
+        images = []
+        for frame in frames:
+            image = Image.frombytes("P", (frame.shape[1], frame.shape[0]), frame.tobytes())
+            image.putpalette(palette)
+            if self.scale != 1:
+                image = image.resize((frame.shape[1] * self.scale, frame.shape[0] * self.scale), Image.NEAREST)
+            images.append(image)
+        if not images:
+            return
+        images[0].save(self.path, format=self.format, save_all=True, append_images=images[1:],
+                       duration=int(1000 / self.fps), loop=0)
+
+    def close(self):
+        """
+        Wait for the writer to write the queued frames and finish the file.
+        """
+        if self.writer.is_alive():
+            self.frames.put(None)
+            self.writer.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,100 @@
+import numpy as np
+import pygame
+from Simulator import WIDTH, HEIGHT, WHITE, HEADERS, EXTENSION_FOR_TEXT, Person
+
+TEXT_COLOR = (100, 100, 100)
+# color of every state code returned by `Simulation.state_grid`: empty, non infected and infected.
+STATE_COLORS = np.array([WHITE, Person.color_not_infected, Person.color_infected], dtype=np.uint8)
+
+
+class GridRenderer:
+    """
+    Draws a simulation on a pygame screen, repainting only what changed since the previous frame.
+
+    The title, legend and parameters are drawn once. The grid lives in a surface with one pixel per
+    cell that is filled from the state array through `pygame.surfarray` and scaled onto the screen,
+    and only the part of the screen covering the changed cells and the generation number is updated.
+    """
+
+    def __init__(self, simulation, screen, large_font, small_font):
+        """
+        Draw the static parts of the window.
+
+        Args:
+            simulation (Simulation): The simulation to draw.
+            screen (pygame.Surface): The window surface.
+            large_font (pygame.font.Font): Font for the title, legend and generation number.
+            small_font (pygame.font.Font): Font for the parameters line.
+        """
+        self.simulation = simulation
+        self.screen = screen
+        self.large_font = large_font
+        self.grid_surface = pygame.Surface((simulation.cols, simulation.rows))
+        # the grid takes a WIDTH x WIDTH square under the legend, like the original per person drawing.
+        scale = WIDTH / max(simulation.rows, simulation.cols)
+        self.cell_size = scale
+        self.grid_rect = pygame.Rect(0, EXTENSION_FOR_TEXT, round(simulation.cols * scale),
+                                     round(simulation.rows * scale))
+        # the generation number sits between the grid and the parameters line.
+        generation_y = EXTENSION_FOR_TEXT + WIDTH
+        self.generation_rect = pygame.Rect(0, generation_y, WIDTH, HEIGHT - 50 - generation_y)
+        self.previous_state = None
+
+        screen.fill(WHITE)
+        simulation_name_text = large_font.render("Simulation Mode : " + simulation.mode, 1, TEXT_COLOR)
+        screen.blit(simulation_name_text, ((WIDTH - simulation_name_text.get_width()) // 2, 0))
+        # how spaces is the headers for each other
+        different = 40
+        x = 0
+        for text, color in HEADERS:
+            text_box = large_font.render(text, 1, color)
+            screen.blit(text_box, (x + different, EXTENSION_FOR_TEXT // 2))
+            x += different + text_box.get_width()
+        parameters = "population_density: %s, s1: %s, s2: %s, s3: %s, s4: %s L: %s" % \
+                     (simulation.p_population_density, simulation.p_s1, simulation.p_s2, simulation.p_s3,
+                      simulation.p_s4, simulation.l_generation)
+        parameters_text = small_font.render(parameters, 1, TEXT_COLOR)
+        screen.blit(parameters_text, ((WIDTH - parameters_text.get_width()) // 2, HEIGHT - 50))
+        pygame.display.update()
+
+    def changed_rect(self, state):
+        """
+        Return the screen rectangle covering every cell whose state changed since the previous frame.
+
+        Args:
+            state (numpy.ndarray): The current state grid.
+
+        Returns:
+            pygame.Rect: The rectangle to update, or None when nothing changed.
+        """
+        if self.previous_state is None:
+            return self.grid_rect
+        changed_rows, changed_cols = np.nonzero(state != self.previous_state)
+        if len(changed_rows) == 0:
+            return None
+        top, bottom = int(changed_rows.min()), int(changed_rows.max()) + 1
+        left, right = int(changed_cols.min()), int(changed_cols.max()) + 1
+        x = int(left * self.cell_size)
+        y = EXTENSION_FOR_TEXT + int(top * self.cell_size)
+        return pygame.Rect(x, y, int(np.ceil(right * self.cell_size)) - x + 1,
+                           EXTENSION_FOR_TEXT + int(np.ceil(bottom * self.cell_size)) - y + 1)
+
+    def render(self):
+        """
+        Draw the current generation and push the changed parts of the screen to the display.
+        """
+        state = self.simulation.state_grid()
+        dirty = []
+        grid_rect = self.changed_rect(state)
+        if grid_rect is not None:
+            # surfarray arrays are indexed (x, y), the state grid is indexed (row, column).
+            pygame.surfarray.blit_array(self.grid_surface, STATE_COLORS[state].transpose(1, 0, 2))
+            self.screen.blit(pygame.transform.scale(self.grid_surface, self.grid_rect.size), self.grid_rect)
+            dirty.append(grid_rect.clip(self.grid_rect))
+            self.previous_state = state.copy()
+
+        self.screen.fill(WHITE, self.generation_rect)
+        gen_text = self.large_font.render(f"Generation number : {self.simulation.generation}", 1, TEXT_COLOR)
+        self.screen.blit(gen_text, ((WIDTH - gen_text.get_width()) // 2, self.generation_rect.y))
+        dirty.append(self.generation_rect)
+        pygame.display.update(dirty)
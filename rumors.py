@@ -0,0 +1,184 @@
+"""
+Command line entry point for running simulations without a window.
+
+Example:
+    python -m rumors run --params parameters.yaml --generations 150 --out results.csv
+    python -m rumors sweep --spec sweep.yaml --out sweep.csv
+"""
+import argparse
+import csv
+from Simulator import Simulation, StopConditions, ENGINES
+
+DEFAULT_GENERATIONS = 150
+RESULT_FIELDS = ["generation", "infected", "total_infected", "rejection_rate"]
+
+
+def load_parameters(path):
+    """
+    Read the simulation parameters from a yaml file.
+
+    Args:
+        path (str): The path of the yaml file.
+
+    Returns:
+        dict: The simulation parameters.
+    """
+    import yaml
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def run_headless(simulation, stop, verbose=True, checkpoint=None, checkpoint_every=None):
+    """
+    Run a simulation until a stop condition is met without rendering it.
+
+    Args:
+        simulation (Simulation): The simulation to run.
+        stop (StopConditions): When to stop the simulation.
+        verbose (bool): Print the number of infected persons after every generation.
+        checkpoint (str): Directory to write checkpoints to.
+        checkpoint_every (int): Write a checkpoint every this many generations (and when the run stops).
+
+    Returns:
+        Simulation: The finished simulation.
+    """
+    stop.start()
+    while not stop.reached(simulation):
+        simulation.update()
+        if verbose:
+            print("generation %d: %d infected, %d in total" %
+                  (simulation.generation, simulation.info[-1], simulation.infected_persons))
+        if checkpoint is not None and checkpoint_every and simulation.generation % checkpoint_every == 0:
+            simulation.save_checkpoint(checkpoint)
+    if checkpoint is not None:
+        simulation.save_checkpoint(checkpoint)
+    return simulation
+
+
+def write_results(path, simulation):
+    """
+    Write the per generation results of a simulation to a csv file.
+
+    Args:
+        path (str): The path of the csv file.
+        simulation (Simulation): A simulation that was already run.
+    """
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_FIELDS)
+        first_generation, total_infected = simulation.history_start()
+        for generation, (infected, rejection_rate) in enumerate(zip(simulation.info, simulation.average_rate),
+                                                                first_generation):
+            total_infected += infected
+            writer.writerow([generation, infected, total_infected, rejection_rate])
+
+
+def run_command(args):
+    overrides = {}
+    if args.engine is not None:
+        overrides["engine"] = args.engine
+    if args.seed is not None:
+        overrides["seed"] = args.seed
+    if args.resume is not None:
+        simulation = Simulation.from_checkpoint(args.resume, overrides)
+    else:
+        parameters = load_parameters(args.params)
+        parameters.update(overrides)
+        simulation = Simulation(parameters)
+    if args.metrics is not None:
+        from metrics import open_sink
+        simulation.metrics_sink = open_sink(args.metrics)
+    if args.stats:
+        simulation.enable_stats()
+    if args.record is not None:
+        from recorder import FrameRecorder
+        simulation.recorder = FrameRecorder(args.record, every=args.record_every)
+        simulation.recorder.capture(simulation)
+    stop = StopConditions(max_generations=args.generations, saturation=args.saturation, time_budget=args.time_budget)
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        simulation = run_headless(simulation, stop, verbose=not args.quiet, checkpoint=args.checkpoint,
+                                  checkpoint_every=args.checkpoint_every)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print("profile written to %s, read it with: python -m pstats %s" % (args.profile, args.profile))
+        if simulation.metrics_sink is not None:
+            simulation.metrics_sink.close()
+        if simulation.recorder is not None:
+            simulation.recorder.close()
+            print("%d frames written to %s, %d dropped" % (simulation.recorder.captured, args.record,
+                                                          simulation.recorder.dropped))
+        simulation.close()
+    if simulation.stats is not None:
+        print(simulation.stats.report())
+    if args.out is not None:
+        write_results(args.out, simulation)
+
+
+def sweep_command(args):
+    from sweep import load_sweep, run_sweep
+    tasks, cached = run_sweep(load_sweep(args.spec), args.out, workers=args.workers, cache=args.cache)
+    print("finished %d runs (%d from the cache), results written to %s" % (tasks, cached, args.out))
+
+
+def plot_command(args):
+    from analysis import read_results, plot_curves
+    plot_curves(read_results(args.results), args.out, title=args.title)
+    print("plot written to %s" % args.out)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="rumors", description="Rumors spreading simulator.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run a single simulation without a window")
+    run_parser.add_argument("--params", default="parameters.yaml", help="yaml file with the simulation parameters")
+    run_parser.add_argument("--generations", type=int, default=DEFAULT_GENERATIONS,
+                            help="number of generations to run (in total, when resuming)")
+    run_parser.add_argument("--saturation", type=int,
+                            help="stop once nobody got infected for this many generations in a row")
+    run_parser.add_argument("--time-budget", type=float, help="stop after this many seconds")
+    run_parser.add_argument("--out", help="csv file to write the per generation results to")
+    run_parser.add_argument("--metrics",
+                            help="file to stream the per generation metrics to (.csv, .ndjson or .parquet)")
+    run_parser.add_argument("--engine", choices=ENGINES, help="override the engine from the parameters file")
+    run_parser.add_argument("--seed", type=int, help="seed of the random generator, overrides the parameters file")
+    run_parser.add_argument("--checkpoint", help="directory to write checkpoints of the simulation to")
+    run_parser.add_argument("--checkpoint-every", type=int, help="write a checkpoint every this many generations")
+    run_parser.add_argument("--resume", help="checkpoint directory to resume the simulation from")
+    run_parser.add_argument("--record", help="gif, png or raw file to record the grid to")
+    run_parser.add_argument("--record-every", type=int, default=1, help="record every this many generations")
+    run_parser.add_argument("--stats", action="store_true",
+                            help="print the time of every phase and the work counters at the end")
+    run_parser.add_argument("--profile", help="file to write the cProfile statistics of the run to")
+    run_parser.add_argument("--quiet", action="store_true", help="do not print the per generation counts")
+    run_parser.set_defaults(func=run_command)
+
+    sweep_parser = subparsers.add_parser("sweep", help="run a parameter sweep on all the cores")
+    sweep_parser.add_argument("--spec", default="sweep.yaml", help="yaml file describing the sweep")
+    sweep_parser.add_argument("--out", default="sweep.csv", help="csv file to stream the results to")
+    sweep_parser.add_argument("--workers", type=int, help="number of worker processes, all the cores by default")
+    sweep_parser.add_argument("--cache", help="directory of the result cache, overrides the sweep file")
+    sweep_parser.set_defaults(func=sweep_command)
+
+    plot_parser = subparsers.add_parser("plot", help="plot the results of a run or a sweep to an image file")
+    plot_parser.add_argument("results", help="csv file written by run --out or by sweep")
+    plot_parser.add_argument("--out", default="results.png", help="image file to write the plot to")
+    plot_parser.add_argument("--title", default="", help="title of the plot")
+    plot_parser.set_defaults(func=plot_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
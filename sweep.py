@@ -0,0 +1,229 @@
+"""
+Parameter sweeps that spread many simulation runs across all the cores of the machine.
+
+A sweep is described by a yaml file, for example:
+
+    base:
+        mode: slow
+    grid:
+        p_population_density: [0.5, 0.75]
+        p_s1: [0.2, 0.3]
+        p_s2: [0.3]
+        p_s3: [0.4, 0.3]
+        p_s4: [0.1]
+        l_generation: [2, 5]
+    replicates: 100
+    generations: 150
+    seed: 1
+
+With `cache: <directory>` (and optionally `cache_size` in bytes) finished runs are kept in a `ResultCache`
+and taken from it when the sweep is run again, so rerunning a sweep after a crash or with a few changed
+values only runs the new tasks.
+
+Instead of `grid` a `sample` section draws `samples` random configurations: a two item list of numbers
+is a uniform range (integers for `l_generation`), any other list is a set of choices. Grid combinations
+whose skepticism probabilities do not sum to 1 are skipped, sampled ones are normalized.
+"""
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from Simulator import Simulation
+
+SWEEP_PARAMETERS = ["p_population_density", "p_s1", "p_s2", "p_s3", "p_s4", "l_generation", "mode"]
+SKEPTICISM_PARAMETERS = ["p_s1", "p_s2", "p_s3", "p_s4"]
+RESULT_FIELDS = ["task", "replicate", "seed"] + SWEEP_PARAMETERS + \
+                ["generation", "infected", "total_infected", "rejection_rate"]
+
+
+def load_sweep(path):
+    """
+    Read a sweep description from a yaml file.
+
+    Args:
+        path (str): The path of the yaml file.
+
+    Returns:
+        dict: The sweep description.
+    """
+    import yaml
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def grid_configurations(grid):
+    """
+    Build every combination of the values in `grid`.
+
+    Args:
+        grid (dict): Maps parameter names to the list of values to try.
+
+    Returns:
+        list: The configurations (dicts) whose skepticism probabilities sum to 1.
+    """
+    names = list(grid)
+    configurations = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        configuration = dict(zip(names, values))
+        if all(name in configuration for name in SKEPTICISM_PARAMETERS) and \
+                abs(sum(configuration[name] for name in SKEPTICISM_PARAMETERS) - 1) > 1e-9:
+            continue
+        configurations.append(configuration)
+    return configurations
+
+
+def sample_configurations(sample, samples, rng):
+    """
+    Draw random configurations.
+
+    Args:
+        sample (dict): Maps parameter names to a [low, high] range or to a list of choices.
+        samples (int): The number of configurations to draw.
+        rng (random.Random): The generator used for the draws.
+
+    Returns:
+        list: The drawn configurations (dicts).
+    """
+    configurations = []
+    for _ in range(samples):
+        configuration = {}
+        for name, values in sample.items():
+            if len(values) == 2 and all(isinstance(value, (int, float)) for value in values):
+                if name == "l_generation":
+                    configuration[name] = rng.randint(values[0], values[1])
+                else:
+                    configuration[name] = rng.uniform(values[0], values[1])
+            else:
+                configuration[name] = rng.choice(values)
+        if all(name in configuration for name in SKEPTICISM_PARAMETERS):
+            total = sum(configuration[name] for name in SKEPTICISM_PARAMETERS)
+            for name in SKEPTICISM_PARAMETERS:
+                configuration[name] /= total
+        configurations.append(configuration)
+    return configurations
+
+
+def configuration_key(configuration):
+    """
+    Return an int identifying the values of a configuration, whatever its position in the sweep.
+    """
+    from cache import normalize
+    content = json.dumps(normalize(configuration), sort_keys=True)
+    return int(hashlib.sha256(content.encode()).hexdigest()[:16], 16)
+
+
+def build_tasks(sweep):
+    """
+    Expand a sweep description into one task per configuration and replicate.
+
+    Every task gets its own seed, derived from the sweep seed, its configuration and its replicate number,
+    so a sweep gives the same results no matter how its tasks are scheduled on the workers, and adding
+    values or replicates to a sweep keeps the seeds (and the cached results) of the tasks it already had.
+
+    Args:
+        sweep (dict): The sweep description.
+
+    Returns:
+        list: Tuples of (task number, replicate, seed, parameters, generations).
+    """
+    seed = sweep.get("seed", 0)
+    if "grid" in sweep:
+        configurations = grid_configurations(sweep["grid"])
+    else:
+        configurations = sample_configurations(sweep["sample"], sweep.get("samples", 1), random.Random(seed))
+    replicates = sweep.get("replicates", 1)
+    generations = sweep.get("generations", 150)
+    tasks = []
+    for number, (configuration, replicate) in enumerate(itertools.product(configurations, range(replicates))):
+        parameters = dict(sweep.get("base", {}))
+        parameters.update(configuration)
+        # an independent child stream per task, stored as an int so a single row can be rerun from the output.
+        child = np.random.SeedSequence(seed, spawn_key=(configuration_key(configuration), replicate))
+        parameters["seed"] = int(child.generate_state(1, np.uint64)[0])
+        tasks.append((number, replicate, parameters["seed"], parameters, generations))
+    return tasks
+
+
+def run_task(task):
+    """
+    Run a single sweep task, this is the function executed by the worker processes.
+
+    Args:
+        task (tuple): A task as built by `build_tasks`.
+
+    Returns:
+        tuple: The task, the number of persons infected before the first kept generation, the `info` and
+        `average_rate` lists of the finished simulation and the number of the first kept generation.
+    """
+    number, replicate, seed, parameters, generations = task
+    # every generation is written, whatever the history limit of the parameters.
+    simulation = Simulation(dict(parameters, history_limit=None))
+    try:
+        for _ in range(generations):
+            simulation.update()
+    finally:
+        simulation.close()
+    first_generation, infected_before = simulation.history_start()
+    return task, infected_before, simulation.info, simulation.average_rate, first_generation
+
+
+def write_task_rows(writer, task, total_infected, info, average_rate, first_generation=1):
+    """
+    Write the rows of a finished task, one per generation, from the generation `first_generation` on with
+    `total_infected` persons infected before it.
+    """
+    number, replicate, seed, parameters, _ = task
+    values = [parameters.get(name) for name in SWEEP_PARAMETERS]
+    for generation, (infected, rejection_rate) in enumerate(zip(info, average_rate), first_generation):
+        total_infected += infected
+        writer.writerow([number, replicate, seed] + values + [generation, infected, total_infected, rejection_rate])
+
+
+def run_sweep(sweep, out, workers=None, cache=None):
+    """
+    Run all the tasks of a sweep on a process pool and stream the results to a csv file.
+
+    Rows are written as soon as a task finishes, one row per task and generation. Tasks found in the cache
+    are written first without being run.
+
+    Args:
+        sweep (dict): The sweep description.
+        out (str): The path of the csv file.
+        workers (int): The number of worker processes, all the cores by default.
+        cache (str): Directory of the result cache, the "cache" entry of the sweep by default.
+
+    Returns:
+        tuple: The number of tasks and the number of them taken from the cache.
+    """
+    tasks = build_tasks(sweep)
+    cache = cache or sweep.get("cache")
+    if cache is not None:
+        from cache import ResultCache, DEFAULT_CACHE_SIZE
+        cache = ResultCache(cache, sweep.get("cache_size", DEFAULT_CACHE_SIZE))
+    with open(out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_FIELDS)
+        pending = []
+        for task in tasks:
+            result = cache.get(task[3], task[4]) if cache is not None else None
+            if result is None:
+                pending.append(task)
+            else:
+                write_task_rows(writer, task, result["summary"]["initial_infected"], result["info"],
+                                result["average_rate"])
+        f.flush()
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                futures = [executor.submit(run_task, task) for task in pending]
+                for future in as_completed(futures):
+                    task, total_infected, info, average_rate, first_generation = future.result()
+                    write_task_rows(writer, task, total_infected, info, average_rate, first_generation)
+                    f.flush()
+                    # only this process writes to the cache, the workers just run the tasks.
+                    if cache is not None:
+                        cache.put(task[3], task[4], total_infected, info, average_rate)
+    return len(tasks), len(tasks) - len(pending)
@@ -0,0 +1,23 @@
+"""
+Every replicate of `batch.ReplicateBatch` is the run of `Simulation` with the seed of that replicate.
+"""
+import pytest
+from batch import ReplicateBatch
+from Simulator import Simulation
+
+PARAMETERS = {"rows": 30, "cols": 30, "p_population_density": 0.75, "p_s1": 0.4, "p_s2": 0.3, "p_s3": 0.2,
+              "p_s4": 0.1, "mode": "default", "seed": 7}
+
+
+@pytest.mark.parametrize("l_generation", [0, 2])
+def test_replicates_match_the_reference_runs(l_generation):
+    parameters = dict(PARAMETERS, l_generation=l_generation)
+    batch = ReplicateBatch(parameters, replicates=6)
+    info, average_rate = batch.run(25)
+    assert info.sum() > 0
+    for r, seed in enumerate(batch.seeds):
+        simulation = Simulation(dict(parameters, seed=seed))
+        for _ in range(25):
+            simulation.update()
+        assert info[r].tolist() == list(simulation.info)
+        assert average_rate[r].tolist() == list(simulation.average_rate)
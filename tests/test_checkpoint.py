@@ -0,0 +1,48 @@
+"""
+A resumed run continues exactly like the saved one: checkpoints of the graph engine keep the graph, so it is
+not rebuilt, and checkpoints keep the seed the tiled engine derives its streams from.
+"""
+import pytest
+from Simulator import Simulation, spawn_seeds
+
+PARAMETERS = {"rows": 10, "cols": 10, "p_population_density": 0.75, "p_s1": 0.25, "p_s2": 0.25, "p_s3": 0.25,
+              "p_s4": 0.25, "l_generation": 1, "mode": "default", "seed": 2, "engine": "graph"}
+
+
+def test_resumed_graph_run_ignores_changes_to_the_edge_list(tmp_path):
+    pytest.importorskip("scipy")
+    edges = tmp_path / "edges.txt"
+    edges.write_text("".join("%d %d\n" % (node, (node + step) % 200) for node in range(200) for step in (1, 7)))
+    simulation = Simulation(dict(PARAMETERS, topology={"type": "edges", "path": str(edges)}))
+    for _ in range(3):
+        simulation.update()
+    simulation.save_checkpoint(str(tmp_path / "checkpoint"))
+    edges.write_text("0 1\n")
+
+    resumed = Simulation.from_checkpoint(str(tmp_path / "checkpoint"))
+    assert (resumed.graph != simulation.graph).nnz == 0
+    for _ in range(5):
+        simulation.update()
+        resumed.update()
+    assert list(resumed.info) == list(simulation.info)
+
+
+def test_resumed_tiled_run_keeps_a_spawned_seed(tmp_path):
+    parameters = dict(PARAMETERS, rows=24, cols=24, l_generation=2, seed=spawn_seeds(7, 2)[1], engine="tiled",
+                      tiles=[2, 2], workers=2)
+    simulation = Simulation(parameters)
+    resumed = None
+    try:
+        for _ in range(3):
+            simulation.update()
+        simulation.save_checkpoint(str(tmp_path / "checkpoint"))
+        resumed = Simulation.from_checkpoint(str(tmp_path / "checkpoint"))
+        for _ in range(5):
+            simulation.update()
+            resumed.update()
+    finally:
+        simulation.close()
+        if resumed is not None:
+            resumed.close()
+    assert list(resumed.info) == list(simulation.info)
+    assert list(resumed.average_rate) == list(simulation.average_rate)
@@ -0,0 +1,63 @@
+"""
+The engines run two different models: the reference one (sequential generations) and the synchronous one of
+`SYNCHRONOUS_ENGINES`. These tests pin where the models agree and where they diverge.
+"""
+import pytest
+from Simulator import Simulation, ENGINES, SYNCHRONOUS_ENGINES
+
+# a full grid of level 1 persons that pass the rumor to every neighbour, so nothing is random.
+DETERMINISTIC = {"rows": 30, "cols": 30, "p_population_density": 1.0, "p_s1": 1, "p_s2": 0, "p_s3": 0, "p_s4": 0,
+                 "l_generation": 0, "mode": "default", "seed": 1}
+RANDOM = {"rows": 40, "cols": 40, "p_population_density": 0.75, "p_s1": 0.25, "p_s2": 0.25, "p_s3": 0.25,
+          "p_s4": 0.25, "l_generation": 2, "mode": "default", "seed": 3}
+
+
+def run(parameters, engine, generations):
+    simulation = Simulation(dict(parameters, engine=engine))
+    try:
+        for _ in range(generations):
+            simulation.update()
+    finally:
+        simulation.close()
+    return list(simulation.info), list(simulation.average_rate)
+
+
+@pytest.mark.parametrize("engine", ["tiled"])
+def test_synchronous_engines_grow_one_ring_per_generation(engine):
+    # the rumor reaches the persons at Chebyshev distance g in generation g: 8 * g of them.
+    info, _ = run(DETERMINISTIC, engine, 5)
+    assert info == [8, 16, 24, 32, 40]
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy", "frontier", "numba", "graph"])
+def test_reference_engines_spread_within_a_generation(engine):
+    # persons infected earlier in the generation spread in the same one, so the first generation goes further.
+    info, _ = run(DETERMINISTIC, engine, 5)
+    assert info == [18, 102, 192, 377, 208]
+
+
+@pytest.mark.parametrize("engine", ["numpy", "frontier", "numba", "graph"])
+def test_reference_engines_match_python(engine):
+    assert run(RANDOM, engine, 30) == run(RANDOM, "python", 30)
+
+
+@pytest.mark.parametrize("changes", [{"l_generation": 0}, {"mode": "fast"}, {"mode": "slow", "l_generation": 0},
+                                     {"rows": 25, "cols": 60, "p_population_density": 1.0}])
+def test_numpy_engine_matches_python(changes):
+    parameters = dict(RANDOM, **changes)
+    simulation = Simulation(dict(parameters, engine="numpy"))
+    reference = Simulation(dict(parameters, engine="python"))
+    for _ in range(30):
+        simulation.update()
+        reference.update()
+    assert list(simulation.info) == list(reference.info)
+    assert list(simulation.average_rate) == list(reference.average_rate)
+    assert simulation.random_buffer.drawn() == reference.random_buffer.drawn()
+    for ours, theirs in zip(simulation.population(), reference.population()):
+        assert (ours == theirs).all()
+
+
+def test_synchronous_engines_are_a_different_model():
+    assert set(SYNCHRONOUS_ENGINES) < set(ENGINES)
+    assert "python" not in SYNCHRONOUS_ENGINES
+    assert run(DETERMINISTIC, "tiled", 5) != run(DETERMINISTIC, "python", 5)
@@ -0,0 +1,21 @@
+"""
+The stop conditions of a run, saturation must not depend on how much of the history is kept.
+"""
+from Simulator import Simulation, StopConditions
+
+PARAMETERS = {"rows": 10, "cols": 10, "p_population_density": 0.75, "p_s1": 0.25, "p_s2": 0.25, "p_s3": 0.25,
+              "p_s4": 0.25, "l_generation": 0, "mode": "default", "seed": 3}
+
+
+def generations_until_saturation(parameters, saturation):
+    simulation = Simulation(parameters)
+    stop = StopConditions(max_generations=1000, saturation=saturation)
+    while not stop.reached(simulation):
+        simulation.update()
+    return simulation.generation
+
+
+def test_saturation_with_a_shorter_history_limit():
+    generations = generations_until_saturation(PARAMETERS, 5)
+    assert generations < 1000
+    assert generations_until_saturation(dict(PARAMETERS, history_limit=2), 5) == generations
@@ -0,0 +1,39 @@
+"""
+The tiled engine runs its tiles in worker processes, these tests check it works with every start method and
+fails instead of hanging when a worker is gone.
+"""
+import multiprocessing
+import pytest
+from Simulator import Simulation
+
+PARAMETERS = {"rows": 24, "cols": 24, "p_population_density": 0.75, "p_s1": 0.25, "p_s2": 0.25, "p_s3": 0.25,
+              "p_s4": 0.25, "l_generation": 2, "mode": "default", "seed": 5, "engine": "tiled", "tiles": [2, 2],
+              "workers": 2}
+
+
+def run(parameters, generations):
+    simulation = Simulation(parameters)
+    try:
+        for _ in range(generations):
+            simulation.update()
+    finally:
+        simulation.close()
+    return list(simulation.info), list(simulation.average_rate)
+
+
+@pytest.mark.parametrize("start_method", ["spawn", "forkserver"])
+def test_start_methods_give_the_same_run(start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip("%s is not available on this platform" % start_method)
+    assert run(dict(PARAMETERS, start_method=start_method), 5) == run(PARAMETERS, 5)
+
+
+def test_step_raises_when_a_worker_is_killed():
+    simulation = Simulation(dict(PARAMETERS, step_timeout=30))
+    try:
+        simulation.update()
+        simulation.engine.processes[0].kill()
+        with pytest.raises(RuntimeError):
+            simulation.update()
+    finally:
+        simulation.close()
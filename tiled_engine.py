@@ -0,0 +1,392 @@
+"""
+Multi-core engine for `Simulation.update`.
+
+The toroidal grid is split into a fixed grid of tiles (the "tiles" parameter, [rows, cols] of tiles). Every
+tile keeps its state, skepticism, cooldown and received arrays with a one-cell halo around them, in
+`multiprocessing.shared_memory` blocks, and worker processes (the "workers" parameter, all the cores by
+default) advance their tiles in parallel. A generation runs the synchronous model of the kernels of
+numpy_engine.py (see `SYNCHRONOUS_ENGINES`) in two phases separated by barriers:
+
+1. Every tile counts the rumors, lets its active spreaders try their neighbours (the cells in the halo
+   included) and marks the cells the rumor was passed to in its received array.
+2. Every tile collects the received marks of its own cells, from its own array and from the halos of the
+   neighbouring tiles, infects them and cools its spreaders down. Then the tiles copy the edges of their
+   neighbours into their state halo for the next generation.
+
+The random numbers of a tile in a generation are drawn from a generator seeded with the simulation seed,
+the tile and the generation, so a run only depends on the seed and the tiles, not on the number of workers,
+and resuming from a checkpoint continues the same run.
+
+The workers are started with the "start_method" parameter of multiprocessing (its default when not set). A
+watchdog thread breaks the barriers as soon as a worker (or, in a worker, the engine process) exits, and a
+generation that takes longer than the "step_timeout" parameter (in seconds) is abandoned, so `step` raises
+a RuntimeError instead of waiting forever.
+"""
+import os
+import threading
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from threading import BrokenBarrierError
+import numpy as np
+from Simulator import EMPTY_STATE, NON_INFECTED_STATE, INFECTED_STATE, MOVE_SET, LEVELS
+from numpy_engine import count_rumors, effective_skepticism, spread_attempts, cool_down
+
+DEFAULT_TILES = [4, 4]
+TILE_ARRAYS = [("state", np.int8), ("skepticism", np.int8), ("stop_spreading_duration", np.int32),
+               ("received", np.bool_)]
+# commands of the control block.
+STOP = 0
+STEP = 1
+DEFAULT_STEP_TIMEOUT = 600
+# columns of the counts block: the newly infected persons, the rejected attempts, then the newly infected
+# persons of every skepticism level.
+COUNTS = 3 + len(LEVELS)
+# halo and edge of a padded tile on the side of a move, for the rows (or the columns) of the move.
+HALO = {-1: slice(0, 1), 0: slice(1, -1), 1: slice(-1, None)}
+EDGE = {-1: slice(1, 2), 0: slice(1, -1), 1: slice(-2, -1)}
+# the same edge, in the coordinates of the tile without its halo.
+INNER_EDGE = {-1: slice(0, 1), 0: slice(None), 1: slice(-1, None)}
+
+
+def split_bounds(length, parts):
+    """
+    Return the `parts + 1` boundaries splitting `length` cells into parts of nearly the same size.
+    """
+    sizes = [length // parts + (1 if i < length % parts else 0) for i in range(parts)]
+    return np.concatenate(([0], np.cumsum(sizes))).tolist()
+
+
+class TileLayout:
+    """
+    The split of a rows x cols grid into tile_rows x tile_cols tiles, numbered in row-major order.
+
+    Args:
+        rows (int): The number of rows in the grid.
+        cols (int): The number of columns in the grid.
+        tile_rows (int): The number of tiles along the rows.
+        tile_cols (int): The number of tiles along the columns.
+    """
+
+    def __init__(self, rows, cols, tile_rows, tile_cols):
+        self.tile_rows = tile_rows
+        self.tile_cols = tile_cols
+        self.row_bounds = split_bounds(rows, tile_rows)
+        self.col_bounds = split_bounds(cols, tile_cols)
+        self.padded_shapes = []
+        self.offsets = []
+        size = 0
+        for t in range(tile_rows * tile_cols):
+            top, bottom, left, right = self.bounds(t)
+            shape = (bottom - top + 2, right - left + 2)
+            self.padded_shapes.append(shape)
+            self.offsets.append(size)
+            size += shape[0] * shape[1]
+        self.size = size
+
+    def __len__(self):
+        return self.tile_rows * self.tile_cols
+
+    def bounds(self, t):
+        """
+        Return the first row, last row + 1, first column and last column + 1 of tile `t` in the grid.
+        """
+        a, b = divmod(t, self.tile_cols)
+        return self.row_bounds[a], self.row_bounds[a + 1], self.col_bounds[b], self.col_bounds[b + 1]
+
+    def neighbour(self, t, row, col):
+        """
+        Return the tile next to tile `t` in the direction of the move (row, col), on the torus.
+        """
+        a, b = divmod(t, self.tile_cols)
+        return (a + row) % self.tile_rows * self.tile_cols + (b + col) % self.tile_cols
+
+
+def tile_views(layout, blocks):
+    """
+    Return, for every tile, a dict of its padded arrays in the shared memory blocks.
+
+    Args:
+        layout (TileLayout): The tiles.
+        blocks (dict): The shared memory block of every array in `TILE_ARRAYS`.
+
+    Returns:
+        list: One dict of (rows + 2, cols + 2) arrays per tile.
+    """
+    tiles = []
+    for shape, offset in zip(layout.padded_shapes, layout.offsets):
+        tiles.append({name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf,
+                                       offset=offset * np.dtype(dtype).itemsize)
+                      for name, dtype in TILE_ARRAYS})
+    return tiles
+
+
+def exchange_halo(layout, tiles, t, name):
+    """
+    Copy the edges of the neighbouring tiles into the halo of tile `t` for array `name`.
+    """
+    own = tiles[t][name]
+    for row, col in MOVE_SET:
+        neighbour = tiles[layout.neighbour(t, row, col)][name]
+        own[HALO[row], HALO[col]] = neighbour[EDGE[-row], EDGE[-col]]
+
+
+def gather_received(layout, tiles, t):
+    """
+    Return the cells of tile `t` the rumor was passed to, by its own spreaders and the neighbouring tiles.
+
+    Returns:
+        numpy.ndarray: A mask of the cells of the tile, without its halo.
+    """
+    received = tiles[t]["received"][1:-1, 1:-1].copy()
+    for row, col in MOVE_SET:
+        # the halo of the neighbour on the opposite side covers this edge of the tile.
+        neighbour = tiles[layout.neighbour(t, row, col)]["received"]
+        received[INNER_EDGE[row], INNER_EDGE[col]] |= neighbour[HALO[-row], HALO[-col]]
+    return received
+
+
+def tile_generator(seed_sequence, t, generation):
+    """
+    Return the random generator of tile `t` in a generation.
+    """
+    key = seed_sequence.spawn_key + (t, generation)
+    return np.random.default_rng(np.random.SeedSequence(seed_sequence.entropy, spawn_key=key))
+
+
+def spreading_phase(tile, t, generation, l_generation, seed_sequence, counts):
+    """
+    First phase of a generation for one tile: the spreaders mark the cells they pass the rumor to.
+
+    Returns:
+        numpy.ndarray: The cells of the padded tile that were infected at the start of the generation.
+    """
+    state = tile["state"]
+    stop_spreading_duration = tile["stop_spreading_duration"]
+    infected = state == INFECTED_STATE
+    skepticism = effective_skepticism(tile["skepticism"], count_rumors(state))
+    spreader_rows, spreader_cols = np.nonzero((infected & (stop_spreading_duration == 0))[1:-1, 1:-1])
+    spreaders = (spreader_rows + 1, spreader_cols + 1)
+    draws = tile_generator(seed_sequence, t, generation).random((len(MOVE_SET), len(spreader_rows)))
+    received, succeeded, rejections = spread_attempts(state, skepticism, l_generation, spreaders, draws)
+    tile["received"][:] = received
+    stop_spreading_duration[tuple(axis[succeeded] for axis in spreaders)] = l_generation
+    counts[t, 1] = rejections.sum()
+    return infected
+
+
+def receiving_phase(layout, tiles, t, infected, counts):
+    """
+    Second phase of a generation for one tile: infect the cells that received the rumor and cool down.
+    """
+    state = tiles[t]["state"][1:-1, 1:-1]
+    newly_infected = gather_received(layout, tiles, t) & (state == NON_INFECTED_STATE)
+    state[newly_infected] = INFECTED_STATE
+    counts[t, 0] = np.count_nonzero(newly_infected)
+    counts[t, 2:] = np.bincount(tiles[t]["skepticism"][1:-1, 1:-1][newly_infected], minlength=len(LEVELS) + 1)
+    cool_down(tiles[t]["stop_spreading_duration"], infected)
+
+
+def watch_processes(sentinels, barriers):
+    """
+    Body of a watchdog thread: abort the barriers once one of the processes of `sentinels` exits.
+    """
+    wait(sentinels)
+    for barrier in barriers:
+        barrier.abort()
+
+
+def start_watchdog(sentinels, barriers):
+    threading.Thread(target=watch_processes, args=(sentinels, barriers), name="tiled-watchdog",
+                     daemon=True).start()
+
+
+def tile_worker(layout, blocks, counts_block, control_block, own_tiles, step_barrier, tile_barrier, l_generation,
+                seed_sequence):
+    """
+    Advance the tiles `own_tiles` one generation every time the engine steps, until it stops.
+    """
+    try:
+        # do not outlive the engine process when it is killed before it could stop the workers.
+        start_watchdog([multiprocessing.parent_process().sentinel], [step_barrier, tile_barrier])
+        tiles = tile_views(layout, blocks)
+        counts = np.ndarray((len(layout), COUNTS), dtype=np.int64, buffer=counts_block.buf)
+        control = np.ndarray(2, dtype=np.int64, buffer=control_block.buf)
+        while True:
+            step_barrier.wait()
+            if control[0] == STOP:
+                return
+            generation = int(control[1])
+            infected = {t: spreading_phase(tiles[t], t, generation, l_generation, seed_sequence, counts)
+                        for t in own_tiles}
+            tile_barrier.wait()
+            for t in own_tiles:
+                receiving_phase(layout, tiles, t, infected[t], counts)
+            tile_barrier.wait()
+            for t in own_tiles:
+                exchange_halo(layout, tiles, t, "state")
+            step_barrier.wait()
+    except BaseException:
+        # wake up the engine and the other workers instead of leaving them waiting forever.
+        step_barrier.abort()
+        tile_barrier.abort()
+        raise
+
+
+def shutdown(processes, blocks, control_block, step_barrier, tile_barrier):
+    """
+    Stop the workers and free the shared memory blocks.
+    """
+    control = np.ndarray(2, dtype=np.int64, buffer=control_block.buf)
+    control[0] = STOP
+    del control
+    try:
+        step_barrier.wait(timeout=10)
+    except BrokenBarrierError:
+        tile_barrier.abort()
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            # arrays of the engine still point into the block when it is closed at exit.
+            pass
+        block.unlink()
+
+
+class TiledEngine:
+    """
+    Engine for `Simulation.update` advancing the tiles of the grid in parallel worker processes.
+
+    No `Person` objects are created. Call `close` (or `Simulation.close`) to stop the workers and free
+    the shared memory, otherwise it happens when the engine is garbage collected or the program exits.
+    """
+
+    def __init__(self, simulation, cells, types, states, cooldowns=None):
+        """
+        Copy the population placed by `Simulation.init_simulation` into the tiles and start the workers.
+
+        Args:
+            simulation (Simulation): The simulation this engine advances.
+            cells (numpy.ndarray): The flat (row-major) cell index of every person.
+            types (numpy.ndarray): The original skepticism level of every person.
+            states (numpy.ndarray): The NON_INFECTED_STATE or INFECTED_STATE code of every person.
+            cooldowns (numpy.ndarray): The stop_spreading_duration of every person, all 0 by default.
+        """
+        self.simulation = simulation
+        self.rows = simulation.rows
+        self.cols = simulation.cols
+        tile_rows, tile_cols = simulation.parameters.get("tiles", DEFAULT_TILES)
+        self.layout = TileLayout(self.rows, self.cols, min(tile_rows, self.rows), min(tile_cols, self.cols))
+        workers = simulation.parameters.get("workers") or os.cpu_count()
+        workers = max(1, min(workers, len(self.layout)))
+        self.step_timeout = simulation.parameters.get("step_timeout", DEFAULT_STEP_TIMEOUT)
+        seed = simulation.seed
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+        self.blocks = {name: shared_memory.SharedMemory(create=True, size=max(1, self.layout.size *
+                                                                                np.dtype(dtype).itemsize))
+                       for name, dtype in TILE_ARRAYS}
+        counts_block = shared_memory.SharedMemory(create=True, size=len(self.layout) * COUNTS * 8)
+        control_block = shared_memory.SharedMemory(create=True, size=2 * 8)
+        self.tiles = tile_views(self.layout, self.blocks)
+        self.counts = np.ndarray((len(self.layout), COUNTS), dtype=np.int64, buffer=counts_block.buf)
+        self.control = np.ndarray(2, dtype=np.int64, buffer=control_block.buf)
+
+        grids = {name: np.zeros(self.rows * self.cols, dtype=dtype) for name, dtype in TILE_ARRAYS}
+        grids["state"][cells] = states
+        grids["skepticism"][cells] = types
+        if cooldowns is not None:
+            grids["stop_spreading_duration"][cells] = cooldowns
+        for t, tile in enumerate(self.tiles):
+            top, bottom, left, right = self.layout.bounds(t)
+            for name, grid in grids.items():
+                tile[name][:] = 0
+                tile[name][1:-1, 1:-1] = grid.reshape(self.rows, self.cols)[top:bottom, left:right]
+        del grids
+        for t in range(len(self.layout)):
+            exchange_halo(self.layout, self.tiles, t, "state")
+
+        context = multiprocessing.get_context(simulation.parameters.get("start_method"))
+        # both barriers are kept by the engine: with the spawn and forkserver start methods a worker unpickles
+        # them after it started, so they must outlive `__init__`.
+        self.step_barrier = context.Barrier(workers + 1)
+        self.tile_barrier = context.Barrier(workers)
+        self.processes = []
+        for own_tiles in np.array_split(np.arange(len(self.layout)), workers):
+            process = context.Process(target=tile_worker, daemon=True,
+                                      args=(self.layout, self.blocks, counts_block, control_block,
+                                            own_tiles.tolist(), self.step_barrier, self.tile_barrier,
+                                            simulation.l_generation, seed_sequence))
+            process.start()
+            self.processes.append(process)
+        self.finalizer = weakref.finalize(self, shutdown, self.processes,
+                                          list(self.blocks.values()) + [counts_block, control_block],
+                                          control_block, self.step_barrier, self.tile_barrier)
+        start_watchdog([process.sentinel for process in self.processes], [self.step_barrier, self.tile_barrier])
+
+    def step(self):
+        """
+        Advance the population by one generation.
+
+        Returns:
+            tuple: The number of newly infected persons and the number of rejected spreading attempts.
+        """
+        self.control[0] = STEP
+        self.control[1] = self.simulation.generation
+        try:
+            self.step_barrier.wait(self.step_timeout)
+            self.step_barrier.wait(self.step_timeout)
+        except BrokenBarrierError:
+            self.step_barrier.abort()
+            self.tile_barrier.abort()
+            # a worker that failed aborts the barriers before it exits, give it a moment to do so.
+            wait([process.sentinel for process in self.processes], timeout=1)
+            exit_codes = [process.exitcode for process in self.processes if not process.is_alive()]
+            if exit_codes:
+                raise RuntimeError("workers of the tiled engine exited with codes %s" % exit_codes)
+            raise RuntimeError("the tiled engine did not finish generation %d within %s seconds" %
+                               (self.simulation.generation + 1, self.step_timeout))
+        return int(self.counts[:, 0].sum()), int(self.counts[:, 1].sum())
+
+    def newly_infected_levels(self):
+        """
+        Return how many persons of every original skepticism level got infected in the last generation.
+        """
+        return self.counts[:, 2:].sum(axis=0)
+
+    def grid(self, name):
+        """
+        Return a copy of array `name` of the whole grid, assembled from the tiles.
+        """
+        grid = np.empty((self.rows, self.cols), dtype=self.tiles[0][name].dtype)
+        for t, tile in enumerate(self.tiles):
+            top, bottom, left, right = self.layout.bounds(t)
+            grid[top:bottom, left:right] = tile[name][1:-1, 1:-1]
+        return grid
+
+    def state_grid(self):
+        return self.grid("state")
+
+    def population(self):
+        """
+        Return the population as arrays, in the format taken by `Simulation.populate`.
+
+        Returns:
+            tuple: The cells, original skepticism levels, state codes and cooldowns of every person.
+        """
+        state = self.grid("state").reshape(-1)
+        cells = np.flatnonzero(state != EMPTY_STATE)
+        return (cells, self.grid("skepticism").reshape(-1)[cells], state[cells],
+                self.grid("stop_spreading_duration").reshape(-1)[cells])
+
+    def close(self):
+        """
+        Stop the workers and free the shared memory.
+        """
+        self.tiles = self.counts = self.control = None
+        self.finalizer()